@@ -0,0 +1,5 @@
+from .utils import get_clusters
+
+__all__ = [
+    "get_clusters",
+]
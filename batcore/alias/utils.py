@@ -0,0 +1,269 @@
+import re
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from aliasmatching import BirdMatching
+from aliasmatching.utils import email_base, first_name, last_name, name_preprocess
+from scipy.cluster.hierarchy import fcluster, linkage
+
+from batcore.data.cache import get_key, load_cache, save_cache
+
+TOKEN_SEPARATORS = re.compile(r'[^0-9a-z]+')
+USER_COLUMNS = ['initial_id', 'name', 'email', 'login', 'email_base', 'first_name', 'last_name']
+# largest addition to the distances that breaks their ties
+TIE_SCALE = 1e-9 / 2 ** 32
+
+
+def prepare_users(users):
+    """
+    :param users: dataframe with name, email, login and initial_id columns
+    :return: dataframe with the fields used by BirdMatching.distance
+    """
+    users = users.fillna('')
+    users = users.assign(name=users.name.map(name_preprocess), email_base=users.email.map(email_base))
+    users = users.assign(first_name=users.name.map(first_name), last_name=users.name.map(last_name))
+    return users[USER_COLUMNS].reset_index(drop=True)
+
+
+def token_keys(token, prefix_len):
+    """
+    :return: keys of the token. The token itself, its prefix and suffix, so tokens that differ in a few characters
+        share a key
+    """
+    return {token, 'p:' + token[:prefix_len], 's:' + token[-prefix_len:]}
+
+
+def blocking_keys(user, prefix_len=4):
+    """
+    :param user: prepared user
+    :param prefix_len: length of the token prefixes
+    :return: set of blocking keys. Users with the same or similar names, e-mails or logins and users with the name
+        inside the e-mail share at least one key
+    """
+    keys = set()
+    names = [token for token in TOKEN_SEPARATORS.split(user['name'].lower()) if token]
+    for token in names:
+        keys |= token_keys(token, prefix_len)
+    if len(names) > 1:
+        # name written without separators, e.g. in the e-mail
+        keys |= token_keys(names[0] + names[-1], prefix_len) | token_keys(names[-1] + names[0], prefix_len)
+
+    for field in ['email_base', 'login']:
+        if user[field]:
+            keys.add('h:' + user[field].lower())
+    for field in ['email', 'login']:
+        for token in TOKEN_SEPARATORS.split(user[field].lower()):
+            if token:
+                keys |= token_keys(token, prefix_len)
+                # names inside the handle
+                keys.update('p:' + token[i:i + prefix_len] for i in range(1, len(token) - prefix_len + 1))
+    return keys
+
+
+def get_blocks(users, new, prefix_len=4, max_block_size=500):
+    """
+    :param users: list of prepared users
+    :param new: positions of the users that should be matched
+    :param prefix_len: length of the token prefixes
+    :param max_block_size: keys shared by more users are too common to separate aliases and are ignored
+    :return: list of blocks with positions of the users. Each block contains at least one of the new users
+    """
+    new = set(new)
+    index = defaultdict(list)
+    for i, user in enumerate(users):
+        for key in blocking_keys(user, prefix_len):
+            index[key].append(i)
+
+    blocks = {tuple(block) for block in index.values()
+              if 1 < len(block) <= max_block_size and any(i in new for i in block)}
+    return sorted(blocks, key=len, reverse=True)
+
+
+def get_pairs(blocks, new):
+    """
+    :return: sorted pairs of the users from the same block with at least one new user
+    """
+    new = set(new)
+    pairs = set()
+    for block in blocks:
+        for i in range(len(block)):
+            for j in range(i + 1, len(block)):
+                if block[i] in new or block[j] in new:
+                    pairs.add((min(block[i], block[j]), max(block[i], block[j])))
+    return sorted(pairs)
+
+
+def linked_pairs(pairs, users, matcher):
+    """
+    :param pairs: pairs of positions of the users
+    :param users: list of prepared users
+    :param matcher: BirdMatching with the distance parameters
+    :return: pairs with the distance below the threshold. Only such users can be in one cluster
+    """
+    return [(i, j) for i, j in pairs if matcher.distance(users[i], users[j]) < matcher.distance_threshold]
+
+
+def tie_breaker(u1, u2):
+    """
+    :return: tiny addition to the distance of the users that depends only on their ids. With equal distances complete
+        linkage depends on the order of the users, with distinct ones clusters are the same for any order and for
+        any subset that contains all linked users
+    """
+    ids = sorted([str(u1['initial_id']), str(u2['initial_id'])])
+    return zlib.crc32('\n'.join(ids).encode()) * TIE_SCALE
+
+
+def cluster_blocks(blocks, users, matcher):
+    """
+    complete linkage clustering of BirdMatching inside each block
+
+    :param blocks: list of blocks with positions of the users
+    :param users: list of prepared users
+    :param matcher: BirdMatching with the distance parameters
+    :return: list of cluster labels for each block
+    """
+    # clusters are merged while the distance is strictly less than the threshold as in AgglomerativeClustering
+    threshold = np.nextafter(matcher.distance_threshold, 0)
+    labels = []
+    for block in blocks:
+        distances = [matcher.distance(users[block[i]], users[block[j]]) + tie_breaker(users[block[i]], users[block[j]])
+                     for i in range(len(block)) for j in range(i + 1, len(block))]
+        labels.append(fcluster(linkage(np.array(distances), 'complete'), threshold, 'distance'))
+    return labels
+
+
+def local_pairs(pairs, users):
+    """
+    :return: pairs with positions in the list of their users and the list itself. Only these users are sent to the
+        worker process
+    """
+    members = sorted({i for pair in pairs for i in pair})
+    positions = {i: j for j, i in enumerate(members)}
+    return [(positions[i], positions[j]) for i, j in pairs], [users[i] for i in members], members
+
+
+def local_blocks(blocks, users):
+    """
+    :return: blocks with positions in the list of their users and the list itself. Only these users are sent to the
+        worker process
+    """
+    members = sorted({i for block in blocks for i in block})
+    positions = {i: j for j, i in enumerate(members)}
+    return [[positions[i] for i in block] for block in blocks], [users[i] for i in members]
+
+
+def find(parent, i):
+    """
+    :return: root of the element in the union-find forest. Paths are compressed
+    """
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def union(parent, i, j):
+    i, j = find(parent, i), find(parent, j)
+    if i != j:
+        parent[max(i, j)] = min(i, j)
+
+
+def get_linked(pairs, records, matcher, n_jobs):
+    """
+    :return: pairs of users with the distance below the threshold. Pairs are spread across processes with n_jobs
+    """
+    if n_jobs == 1 or len(pairs) < 2:
+        return linked_pairs(pairs, records, matcher)
+    chunks = [pairs[i::n_jobs] for i in range(n_jobs)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = []
+        for chunk in chunks:
+            local, local_users, members = local_pairs(chunk, records)
+            futures.append((executor.submit(linked_pairs, local, local_users, matcher), members))
+        return sorted((members[i], members[j]) for future, members in futures for i, j in future.result())
+
+
+def get_labels(groups, records, matcher, n_jobs):
+    """
+    :return: complete linkage labels of the users for each group. Groups are spread across processes with n_jobs
+    """
+    if n_jobs == 1 or len(groups) < 2:
+        return cluster_blocks(groups, records, matcher)
+    # groups are sorted by size, so round-robin chunks get a similar amount of work
+    chunks = [groups[i::n_jobs] for i in range(n_jobs)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [executor.submit(cluster_blocks, *local_blocks(chunk, records), matcher) for chunk in chunks]
+        results = [future.result() for future in futures]
+    labels = [None] * len(groups)
+    for i, result in enumerate(results):
+        labels[i::n_jobs] = result
+    return labels
+
+
+def get_clusters(users, distance_threshold=0.1, n_jobs=1, cache_dir=None, prefix_len=4, max_block_size=500,
+                 **matcher_args):
+    """
+    alias matching with BirdMatching distance. Instead of all pairs of users only users that share a blocking key
+    are compared. Users with the distance below the threshold are linked and each connected group of linked users is
+    clustered with complete linkage. Clusters never contain users that are not linked, so when all such pairs share a
+    blocking key, clusters are the same as of the complete linkage of all users
+
+    :param users: dataframe with name, email, login and initial_id columns
+    :param distance_threshold: distance parameter for clustering
+    :param n_jobs: number of processes used to compare and cluster the users. Users are processed sequentially when
+        n_jobs=1
+    :param cache_dir: folder where matched users are saved. When specified, only new users are compared and only
+        groups with new users are clustered again, so clusters are the same as when all users are matched at once
+    :param prefix_len: length of the token prefixes used as blocking keys
+    :param max_block_size: maximum number of users that share a blocking key
+    :param matcher_args: other parameters of BirdMatching
+    :return: dict from initial_id to the cluster id
+    """
+    matcher = BirdMatching(distance_threshold=distance_threshold, **matcher_args)
+    cache_key = get_key('linked_aliases', distance_threshold, matcher.score_config, prefix_len, max_block_size)
+
+    state = load_cache(cache_dir, cache_key) if cache_dir is not None else None
+    if state is None:
+        state = {'users': pd.DataFrame(columns=USER_COLUMNS), 'linked': [], 'roots': []}
+
+    known = pd.Index(state['users'].initial_id)
+    new_users = prepare_users(users[~users.initial_id.isin(known)].drop_duplicates('initial_id'))
+    all_users = pd.concat([state['users'], new_users], ignore_index=True)
+    linked = list(state['linked'])
+    roots = list(state['roots']) + list(range(len(known), len(all_users)))
+
+    if len(new_users):
+        records = all_users.to_dict('records')
+        new = range(len(known), len(all_users))
+        blocks = get_blocks(records, new, prefix_len, max_block_size)
+        linked += get_linked(get_pairs(blocks, new), records, matcher, n_jobs)
+
+        # groups of linked users with new users are clustered again, other clusters are kept
+        parent = list(range(len(all_users)))
+        for i, j in linked:
+            union(parent, i, j)
+        groups = defaultdict(list)
+        for i in range(len(all_users)):
+            groups[find(parent, i)].append(i)
+        changed = sorted({find(parent, i) for i in new})
+        for root in changed:
+            for i in groups[root]:
+                roots[i] = i
+        changed = sorted([groups[root] for root in changed if len(groups[root]) > 1], key=len, reverse=True)
+
+        for group, labels in zip(changed, get_labels(changed, records, matcher, n_jobs)):
+            first = {}
+            for i, label in zip(group, labels):
+                roots[i] = first.setdefault(label, i)
+
+        if cache_dir is not None:
+            save_cache(cache_dir, cache_key, {'users': all_users, 'linked': linked, 'roots': roots})
+
+    positions = pd.Index(all_users.initial_id).get_indexer(users.initial_id)
+    ids = pd.factorize(np.array([roots[i] for i in positions]))[0]
+    return dict(zip(users.initial_id, ids.tolist()))
@@ -7,6 +7,7 @@ import networkx as nx
 from community import community_louvain
 
 from batcore.modelbase.recommender import BanRecommenderBase
+from ..utils import get_item_map
 
 
 # TODO look into multiple owners
@@ -34,7 +35,7 @@ class CN(BanRecommenderBase):
 
         super().__init__(no_owner, no_inactive, inactive_time)
 
-        self.users = items2ids['users']
+        self.users = get_item_map(items2ids, 'users')
 
         # Adjacency matrix of developers comment interactions
         self.w = dok_matrix((len(self.users), len(self.users)))
@@ -5,7 +5,7 @@ import numpy as np
 
 from batcore.modelbase.recommender import BanRecommenderBase
 from ..utils import LCSubseq, LCSubstr, LCSuff, LCP
-from ..utils import get_map
+from ..utils import get_map, get_index_array, get_path_table, is_encoded
 
 
 # TODO update
@@ -38,6 +38,10 @@ class RevFinder(BanRecommenderBase):
         self.reviewer_list = items2ids['reviewers']
         self.rev_count = len(self.reviewer_list)
         self.reviewer_map = get_map(self.reviewer_list)
+        # in the encoded datasets reviewer list has ids of the reviewers, their positions are looked up in an array
+        self.encoded = is_encoded(items2ids)
+        self.reviewer_index = get_index_array(self.reviewer_list) if self.encoded else None
+        self.paths, self.path_ids = get_path_table(items2ids)
 
         # self._similarity_cache = [{} for _ in range(4)]
 
@@ -100,9 +104,10 @@ class RevFinder(BanRecommenderBase):
     def update_pull(self, pull):
         pull = copy.deepcopy(pull)
 
-        reviewer_indices = [self.reviewer_map[_reviewer] for _reviewer in pull["reviewer"]]
-
-        pull['reviewer'] = np.array(reviewer_indices)
-        pull['file'] = [f.split('/') for f in pull["file"]]
+        if self.encoded:
+            pull['reviewer'] = self.reviewer_index[np.asarray(pull['reviewer'], dtype=int)]
+        else:
+            pull['reviewer'] = np.array([self.reviewer_map[_reviewer] for _reviewer in pull["reviewer"]])
+        pull['file'] = [self.paths.file_components[self.path_ids.getid(f)] for f in pull["file"]]
 
         return pull
@@ -5,7 +5,7 @@ import numpy as np
 from scipy.sparse import dok_matrix
 
 from batcore.modelbase.recommender import BanRecommenderBase
-from ..utils import norm, sim
+from ..utils import norm, token_sim, get_item_map, get_path_table
 
 
 class RevRec(BanRecommenderBase):
@@ -62,7 +62,9 @@ class RevRec(BanRecommenderBase):
         self.com_file = defaultdict(lambda: defaultdict(lambda: 0))
         self.com_date = defaultdict(lambda: defaultdict(lambda: None))
 
-        self.users = items2ids['users']
+        self.users = get_item_map(items2ids, 'users')
+        # files are kept as ids of the path table and compared by their camel case tokens
+        self.paths, self.path_ids = get_path_table(items2ids)
         self.rc_graph = dok_matrix((len(self.users), len(self.users)))
 
         self.pull_file_part = defaultdict(lambda: defaultdict(lambda: set()))
@@ -193,8 +195,9 @@ class RevRec(BanRecommenderBase):
         cr = defaultdict(lambda: datetime(year=10, month=1, day=1))
 
         for file in pull['file']:
+            tokens = self.paths.token_sets[self.path_ids.getid(file)]
             for f2 in self.com_file:
-                if f2 is not None and sim(file, f2) > self.k:
+                if f2 is not None and token_sim(tokens, self.paths.token_sets[f2]) > self.k:
                     for user in self.com_file[f2]:
                         cf[user] += self.com_file[f2][user]
                         cr[user] = max(cr[user], self.com_date[f2][user])
@@ -246,6 +249,8 @@ class RevRec(BanRecommenderBase):
                     file = event['key_file']
                     if file != file:
                         continue
+                    # comments without a file have None in the not encoded and -1 in the encoded datasets
+                    file = None if file is None or file == -1 else self.path_ids.getid(file)
                     self.com_file[file][user] += 1
                     self.com_date[file][user] = event['date']
 
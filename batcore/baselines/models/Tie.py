@@ -5,7 +5,11 @@ from datetime import timedelta
 import numpy as np
 
 from batcore.modelbase.recommender import BanRecommenderBase
-from ..utils import get_map, pull_sim
+from ..utils import get_map, get_index_array, get_path_table, pull_sim, is_encoded
+
+
+def split_title(title):
+    return title.split(' ')
 
 
 class Tie(BanRecommenderBase):
@@ -17,7 +21,8 @@ class Tie(BanRecommenderBase):
     Paper: `Who Should Review This Change? Putting Text and File Location Analyses Together for More Accurate Recommendations <https://xin-xia.github.io/publication/icsme15.pdf>`_
 
     :param item_list: dict with word_list and reviewer_list
-    :param text_splitter: a function to parse pull comments
+    :param text_splitter: a function to parse pull titles. With the default splitter titles tokenized by the
+        TieDataset are used when the pulls have them
     :param alpha: weight between path-based and text-based recommenders
     :param max_date: time in days after which reviews are not considered
     :param no_owner: flag to add or remove owners of the pull request from the recommendations
@@ -27,7 +32,7 @@ class Tie(BanRecommenderBase):
 
     def __init__(self,
                  item_list,
-                 text_splitter=lambda x: x.split(' '),
+                 text_splitter=split_title,
                  alpha=0.7,
                  max_date=100,
                  no_owner=True,
@@ -41,6 +46,10 @@ class Tie(BanRecommenderBase):
 
         self.reviewer_list = item_list['reviewer_list']
         self.reviewer_map = get_map(item_list['reviewer_list'])
+        # in the encoded datasets reviewer list has ids of the reviewers, their positions are looked up in an array
+        self.encoded = is_encoded(item_list)
+        self.reviewer_index = get_index_array(self.reviewer_list) if self.encoded else None
+        self.paths, self.path_ids = get_path_table(item_list)
         self.review_count_map = {}
 
         self.text_models = [dict() for _ in range(len(item_list['reviewer_list']))]
@@ -105,7 +114,7 @@ class Tie(BanRecommenderBase):
             if old_pull["date"] < start_time:
                 break
 
-            c = pull_sim(old_pull, pull)
+            c = pull_sim(old_pull, pull, self.paths)
             scores[old_pull['reviewer']] += c
 
         return scores
@@ -129,14 +138,21 @@ class Tie(BanRecommenderBase):
         """
         pull = copy.deepcopy(pull)
 
-        word_indices = list(map(lambda x: self.word_map[x],
-                                filter(lambda x: x in self.word_map.keys(),
-                                       self.text_splitter(pull["title"])
-                                       )
-                                ))
-        reviewer_indices = [self.reviewer_map[_reviewer] for _reviewer in pull["reviewer"]]
+        if self.text_splitter is split_title and 'title_tokens' in pull:
+            word_indices = list(pull['title_tokens'])
+        else:
+            word_indices = list(map(lambda x: self.word_map[x],
+                                    filter(lambda x: x in self.word_map.keys(),
+                                           self.text_splitter(pull["title"])
+                                           )
+                                    ))
+        if self.encoded:
+            reviewer_indices = self.reviewer_index[np.asarray(pull['reviewer'], dtype=int)].tolist()
+        else:
+            reviewer_indices = [self.reviewer_map[_reviewer] for _reviewer in pull["reviewer"]]
 
         pull['title'] = word_indices
         pull['reviewer'] = reviewer_indices
+        pull['file'] = [self.path_ids.getid(f) for f in pull['file']]
 
         return pull
@@ -2,18 +2,20 @@ import ast
 import numpy as np
 from functools import partial
 from batcore.modelbase.recommender import BanRecommenderBase
-from ..utils import LCP, path2list
+from ..utils import LCP, get_item_map, get_path_table, is_encoded
 from ray.util.multiprocessing import Pool
 import ray
 
 
-def count_score(f1, pull=None, wrc=None, files=None, users=None):
+def count_score(f1, pull=None, wrc=None, files=None, users=None, paths=None, path_ids=None):
     results = np.zeros(wrc.shape[1])
+    c1 = paths[path_ids.getid(f1)]
     for f2 in pull['file']:
+        lcp = LCP(c1, paths[path_ids.getid(f2)])
         for i in range(wrc.shape[1]):
             val = wrc[files.getid(f2), i]
             if val >= 0:
-                results[i] += val * LCP(path2list(f1), path2list(f2))
+                results[i] += val * lcp
     return results
 
 
@@ -42,8 +44,9 @@ class WRC(BanRecommenderBase):
 
         super().__init__(no_owner, no_inactive, inactive_time)
 
-        self.files = items2ids['files']
-        self.users = items2ids['users']
+        self.files = get_item_map(items2ids, 'files')
+        self.users = get_item_map(items2ids, 'users')
+        self.paths, self.path_ids = get_path_table(items2ids)
 
         self.delta = delta
         self.reviews = []
@@ -52,6 +55,9 @@ class WRC(BanRecommenderBase):
         self.wrc = np.zeros((len(self.files), len(self.users)))
 
         self.known_files = set()
+        # encoded files are remembered by their paths, so known files are iterated and their scores are summed in the
+        # same order as in the not encoded datasets
+        self.file_names = items2ids['files'] if is_encoded(items2ids) else None
 
         # self.scores = {}
         self.p = Pool(10)
@@ -64,7 +70,8 @@ class WRC(BanRecommenderBase):
         f2_id = self.files.getid(f2)
 
         if self.lcp_results[f1_id, f2_id] == -1:
-            self.lcp_results[f1_id, f2_id] = LCP(path2list(f1), path2list(f2))
+            self.lcp_results[f1_id, f2_id] = LCP(self.paths.file_components[self.path_ids.getid(f1)],
+                                                 self.paths.file_components[self.path_ids.getid(f2)])
 
         return self.lcp_results[f1_id, f2_id]
 
@@ -94,8 +101,12 @@ class WRC(BanRecommenderBase):
         #                      product(self.known_files, pull['file_path']))
         #
 
-        res = self.p.map(partial(count_score, pull=pull, wrc=self.wrc, files=self.files, users=self.users),
-                         self.known_files)
+        known_files = self.known_files
+        if self.file_names is not None:
+            known_files = [self.file_names.getid(file) for file in known_files]
+        res = self.p.map(partial(count_score, pull=pull, wrc=self.wrc, files=self.files, users=self.users,
+                                 paths=self.paths.file_components, path_ids=self.path_ids),
+                         known_files)
         # # f = time.time()
         # # print(f - s)
         res = np.vstack(res)
@@ -131,7 +142,7 @@ class WRC(BanRecommenderBase):
                 self.wrc = self.delta * self.wrc
 
                 for file in event['file']:
-                    self.known_files.add(file)
+                    self.known_files.add(file if self.file_names is None else self.file_names[file])
                     for user in event['reviewer']:
                         self.wrc[self.files.getid(file), self.users.getid(user)] += 1 / len(event['reviewer'])
 
@@ -1,10 +1,63 @@
+import numpy as np
+
+from batcore.data.utils import PathTable, camel_split
+
+
 def get_map(L):
     return {e: i for i, e in enumerate(L)}
 
 
-def pull_sim(pull1, pull2):
+def get_index_array(ids):
+    """
+    :param ids: ids of the encoded items in some order
+    :return: array with the position in :param ids: for each of the ids
+    """
+    index = np.zeros(max(ids) + 1 if len(ids) else 0, dtype=np.int64)
+    index[ids] = np.arange(len(ids))
+    return index
+
+
+class IdentityMap:
+    """
+    ItemMap-like object for the encoded datasets, where items are already replaced with their ids
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, i):
+        return i
+
+    def getid(self, item):
+        return item
+
+    def __len__(self):
+        return self.size
+
+
+def is_encoded(items2ids):
+    """
+    :return: True when items2ids were created by a dataset with encoded=True
+    """
+    return items2ids.get('encoded', False)
+
+
+def get_item_map(items2ids, name):
+    """
+    :param items2ids: dict with item maps from the dataset
+    :param name: name of the map
+    :return: map from items2ids. For the encoded datasets identity map of the same size, so ids are used directly
+    """
+    if is_encoded(items2ids):
+        return IdentityMap(len(items2ids[name]))
+    return items2ids[name]
+
+
+def pull_sim(pull1, pull2, paths=None):
     """
     counts file path-based similarity for pull1 and pull2
+
+    :param paths: PathTable. When specified, files of the pulls are ids of the table
     """
     changed_files1 = pull1["file"]
     changed_files2 = pull2["file"]
@@ -12,44 +65,48 @@ def pull_sim(pull1, pull2):
         return 0
     sum_score = 0
     for f1 in changed_files1:
-        s1 = set(f1.split('/'))
+        s1 = set(f1.split('/')) if paths is None else paths.component_sets[f1]
         for f2 in changed_files2:
-            s2 = set(f2.split('/'))
+            s2 = set(f2.split('/')) if paths is None else paths.component_sets[f2]
             sum_score += (len(s1 & s2)) / max(len(s1), len(s2))
     ret = sum_score / (len(changed_files1) * len(changed_files2) + 1)
     return ret
 
 
-def camel_split(path):
+def sim(f1, f2):
     """
-    :param path: file path
-    :return: tokens from path split by '/' and camel case
+    :param f1: file path1
+    :param f2: file path2
+    :return: similarity measure between files
     """
-    tokens = []
-    cur_token = ""
-    for c in path:
-        if c == '/':
-            tokens.append(cur_token)
-            cur_token = ""
-        elif c.isupper():
-            tokens.append(cur_token)
-            cur_token = c
-        else:
-            cur_token += c
-    return tokens
+    return token_sim(set(camel_split(f1)), set(camel_split(f2)))
 
 
-def sim(f1, f2):
+def token_sim(t1, t2):
     """
-    :param f1: file path1
-    :param f2: file path2
+    :param t1: set of camel case tokens of the file1
+    :param t2: set of camel case tokens of the file2
     :return: similarity measure between files
     """
-    t1 = set(camel_split(f1))
-    t2 = set(camel_split(f2))
     return len(t1.intersection(t2)) / len(t1.union(t2))
 
 
+def get_path_table(items2ids):
+    """
+    :return: PathTable of the dataset and map from the files of the events to the ids of the table. When the dataset
+        has no table, it is created from the files map. Without the files map the table is filled with the files of
+        the events
+    """
+    if 'paths' in items2ids:
+        paths = items2ids['paths']
+    elif 'files' in items2ids:
+        paths = PathTable(items2ids['files'])
+    else:
+        paths = PathTable()
+        return paths, paths
+    return paths, IdentityMap(len(paths)) if is_encoded(items2ids) else paths.files
+
+
 def norm(p):
     """
     :param p: list of scores
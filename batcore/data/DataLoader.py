@@ -1,7 +1,15 @@
+import queue
+import threading
 from abc import ABC, abstractmethod
 from copy import deepcopy
 
 import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+from batcore.data.EventStore import ChunkedEvents, EventStore
+from batcore.data.checkpoint import LIST_COLUMNS, get_stream_partitions, read_dictionaries, read_meta, \
+    read_partition
 
 
 class LoaderBase(ABC):
@@ -28,11 +36,9 @@ class StreamLoaderBase(LoaderBase, ABC):
 
     def __init__(self, dataset):
         super().__init__(dataset)
-        data = []
-        for event_type in dataset.data:
-            data += dataset.data[event_type].to_dict('records')
-        data = sorted(data, key=lambda x: x['date'])
-        self.data = deepcopy(data)
+        # events are read from the columnar store of the dataset, rows are created as dicts when they are accessed.
+        # Train data are views of the store. Replaced events are kept by the view of this loader
+        self.data = dataset.get_events().view()
 
     def __iter__(self):
         self.ind = 0
@@ -61,43 +67,106 @@ class StreamLoaderBase(LoaderBase, ABC):
         """
         pass
 
+    def get_mask(self, condition, mask=None):
+        """
+        :param condition: function from the event to bool
+        :param mask: vectorized version of the condition. Function from EventStore to boolean array
+        :return: boolean array with the condition for all events of the store. Masks are cached in the store, so
+            loaders over the same dataset evaluate the condition once
+        """
+        store = self.data.store
+        key = condition if mask is None else mask
+        if key not in store.masks:
+            if mask is None:
+                store.masks[key] = np.fromiter(map(condition, store), dtype=bool, count=len(store))
+            else:
+                store.masks[key] = np.asarray(mask(store), dtype=bool)
+        return store.masks[key]
+
     def replace(self, rev):
-        l = len(self.data[self.ind + 1]['reviewer'])
-        self.data[self.ind + 1]['reviewer'] = deepcopy(self.data[self.ind + 1]['reviewer'])
-        self.data[self.ind + 1]['reviewer'][np.random.randint(l)] = rev
+        """
+        replaces random reviewer of the current test event with rev
+        """
+        return self.replace_at(self.ind + 1, rev)
+
+    def replace_at(self, ind, rev, event=None):
+        """
+        replaces random reviewer of the event at ind with rev
 
-        return self.data[self.ind + 1]
+        :param event: event at ind. When None it is read from the data, otherwise it is copied
+        :return: event with the replaced reviewer
+        """
+        event = self.data[ind] if event is None else dict(event)
+        l = len(event['reviewer'])
+        event['reviewer'] = deepcopy(event['reviewer'])
+        event['reviewer'][np.random.randint(l)] = rev
+        self.data.replace(ind, event)
+
+        return event
 
 
 class StreamUntilConditionLoader(StreamLoaderBase):
     """
-         Stream iterator that iterates until specified amount of events satisfying a condition is met
-     """
-    def __init__(self, dataset, condition, batch_size=1):
+    Stream iterator that iterates until specified amount of events satisfying a condition is met. The condition is
+    evaluated once for all events, batch boundaries are precomputed
+
+    :param condition: function from the event to bool
+    :param batch_size: number of events satisfying the condition in each batch
+    :param mask: vectorized version of the condition. Function from EventStore to boolean array
+    """
+    def __init__(self, dataset, condition, batch_size=1, mask=None):
         super().__init__(dataset)
         self.condition = condition
         self.bs = batch_size
+        self.mask = mask
+        self.batch = 0
+        self.boundaries = self.get_boundaries()
+
+    def get_boundaries(self):
+        """
+        :return: positions of the test events of all batches
+        """
+        positions = np.flatnonzero(self.get_mask(self.condition, self.mask))
+        # the first test event is searched from the third one, as in the event by event iteration
+        positions = positions[np.searchsorted(positions, 2):]
+        return positions[self.bs - 1::self.bs]
+
+    def __iter__(self):
+        self.batch = 0
+        return super().__iter__()
+
+    def __len__(self):
+        return len(self.boundaries)
 
     def get_next(self):
-        if self.ind + 1 >= len(self.data):
-            raise StopIteration
-        og = self.ind
-        try:
-            cnt = 0
-            while cnt < self.bs:
-                self.ind += 1
-                while not self.condition(self.data[self.ind + 1]):
-                    self.ind += 1
-                cnt += 1
-            return self.ind
-        except IndexError:
+        if self.batch >= len(self.boundaries):
             raise StopIteration
+        self.batch += 1
+        return self.boundaries[self.batch - 1] - 1
 
-    def replace(self, rev):
+    def seek(self, key):
+        """
+        moves the iterator, so the next batch is the first batch with the test event at key or after it. Train data
+        of the batch are the same as in the iteration from the start. Should be called after iter
+
+        :param key: date or key_change of the test event
+        """
+        dates = self.data.column('date')[self.boundaries]
+        if isinstance(key, (pd.Timestamp, np.datetime64)) or hasattr(key, 'year'):
+            batch = np.searchsorted(dates, np.datetime64(pd.Timestamp(key)))
+        else:
+            batch = np.flatnonzero(self.data.column('key_change')[self.boundaries] == key)
+            if not len(batch):
+                raise KeyError(key)
+            batch = batch[0]
+        self.batch = int(batch)
+        self.ind = self.boundaries[self.batch - 1] - 1 if self.batch > 0 else 0
+
+    def replace_at(self, ind, rev, event=None):
         if self.bs != 1:
             raise NotImplementedError
         else:
-            return super().replace(rev)
+            return super().replace_at(ind, rev, event)
 
 
 class PullLoader(StreamUntilConditionLoader):
@@ -107,12 +176,17 @@ class PullLoader(StreamUntilConditionLoader):
     """
 
     def __init__(self, dataset, batch_size=1):
-        super().__init__(dataset, self._condition, batch_size)
+        super().__init__(dataset, self._condition, batch_size, self._mask)
 
     @staticmethod
     def _condition(pull):
         return pull['type'] == 'pull' and (len(pull['reviewer']) > 0)
 
+    @staticmethod
+    def _mask(events):
+        _, offsets = events.column('reviewer')
+        return (events.column('type') == 'pull') & (np.diff(offsets) > 0)
+
 
 class PullLoaderAliasTest(StreamUntilConditionLoader):
     """
@@ -121,8 +195,280 @@ class PullLoaderAliasTest(StreamUntilConditionLoader):
     """
 
     def __init__(self, dataset, batch_size=1):
-        super().__init__(dataset, self._condition, batch_size)
+        super().__init__(dataset, self._condition, batch_size, self._mask)
 
     @staticmethod
     def _condition(pull):
         return pull['type'] == 'pull' and not pull['self_review'] and (len(pull['reviewer']) > 0)
+
+    @staticmethod
+    def _mask(events):
+        _, offsets = events.column('reviewer')
+        self_review = events.column('self_review').astype(bool)
+        return (events.column('type') == 'pull') & ~self_review & (np.diff(offsets) > 0)
+
+
+class TimeWindowLoader(StreamLoaderBase):
+    """
+    Stream iterator that splits the events into time windows (hours, days, weeks, ...). Returns all events up to the
+    start of the window as train data and the list of the window's events that satisfy the condition as test data,
+    so the model is fitted once for all test events of the window. Windows without such events are merged with the
+    next window
+
+    :param window: length of the windows as a pandas period alias ('H', 'D', 'W', '2D', ...). Windows are aligned
+        with the calendar
+    :param condition: function from the event to bool. By default pull requests with at least one reviewer are tested
+    :param mask: vectorized version of the condition. Function from EventStore to boolean array
+    """
+
+    def __init__(self, dataset, window='D', condition=None, mask=None):
+        super().__init__(dataset)
+        if condition is None and mask is None:
+            condition, mask = PullLoader._condition, PullLoader._mask
+        self.window = window
+        self.condition = condition
+        self.mask = mask
+        self.batch = 0
+        self.starts, self.stops = self.get_windows()
+
+    def get_windows(self):
+        """
+        :return: positions of the first and after the last events of all test windows
+        """
+        offset = to_offset(self.window)
+        periods = pd.DatetimeIndex(self.data.column('date')).to_period(offset.base).asi8 // offset.n
+        # the first window is used only for training
+        bounds = np.append(np.flatnonzero(np.diff(periods)) + 1, len(periods))
+        starts, stops = bounds[:-1], bounds[1:]
+        if not len(starts):
+            return starts, stops
+        tested = np.logical_or.reduceat(self.get_mask(self.condition, self.mask), starts)
+        return starts[tested], stops[tested]
+
+    def __iter__(self):
+        self.batch = 0
+        return super().__iter__()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __next__(self):
+        """
+        :return: a pair of train data and list of test events
+        """
+        if self.batch >= len(self.starts):
+            raise StopIteration
+
+        from_id = self.ind
+        start, stop = self.starts[self.batch], self.stops[self.batch]
+        self.ind = start
+        self.batch += 1
+
+        mask = self.get_mask(self.condition, self.mask)
+        train = self.data[from_id:start]
+        test = [self.data[i] for i in np.flatnonzero(mask[start:stop]) + start]
+
+        return train, test
+
+    def get_next(self):
+        return self.ind
+
+    def replace_at(self, ind, rev, event=None):
+        raise NotImplementedError
+
+
+class PrefetchLoader(LoaderBase):
+    """
+    Wrapper that prepares the next pairs of train and test data of the loader in a background thread, so slicing and
+    creation of the event dicts overlap with fit and predict of the model. Pairs are returned in the same order, train
+    data are returned as lists of events. Events replaced with replace are also replaced in the prepared train data
+
+    :param loader: loader to prefetch from
+    :param n_prefetch: maximum number of prepared pairs
+    """
+
+    def __init__(self, loader, n_prefetch=2):
+        super().__init__(loader.dataset)
+        self.loader = loader
+        self.n_prefetch = n_prefetch
+        self.data = getattr(loader, 'data', None)
+        self.pairs = None
+        self.stop = None
+        self.thread = None
+        self.test = None
+        self.test_ind = None
+        # replaced events that can be in the prepared train data
+        self.replaced = {}
+
+    def __iter__(self):
+        self.close()
+        iter(self.loader)
+        self.pairs = queue.Queue(self.n_prefetch)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.prefetch, args=(self.pairs, self.stop), daemon=True)
+        self.test_ind = None
+        self.replaced = {}
+        self.thread.start()
+        return self
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __next__(self):
+        """
+        :return: a pair of train and test data
+        """
+        if self.thread is None:
+            raise StopIteration
+        item = self.pairs.get()
+        if isinstance(item, BaseException):
+            self.close()
+            raise item
+
+        train, test, train_start, self.test_ind = item
+        self.test = test
+        if train_start is None:
+            return train, test
+        self.replaced = {ind: event for ind, event in self.replaced.items() if ind >= train_start}
+        for ind, event in self.replaced.items():
+            if ind < train_start + len(train):
+                train[ind - train_start] = event
+        return train, test
+
+    def prefetch(self, pairs, stop):
+        """
+        puts pairs of the loader into the queue until the loader is exhausted or the iteration is stopped. Train data
+        are saved with their position in the stream and test data with the position of the test event
+        """
+        try:
+            while not stop.is_set():
+                # train data of the stream loaders start from the previous position of the loader
+                train_start = getattr(self.loader, 'ind', None)
+                train, test = next(self.loader)
+                test_ind = self.loader.ind + 1 if hasattr(self.loader, 'replace_at') else None
+                self.put(pairs, stop, (list(train), test, train_start, test_ind))
+        except BaseException as e:
+            self.put(pairs, stop, e)
+
+    @staticmethod
+    def put(pairs, stop, item):
+        while not stop.is_set():
+            try:
+                pairs.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def close(self):
+        """
+        stops the background thread
+        """
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+            self.thread = None
+
+    def replace(self, rev):
+        """
+        replaces random reviewer of the current test event with rev
+        """
+        if self.test_ind is None:
+            raise NotImplementedError
+        event = self.loader.replace_at(self.test_ind, rev, self.test)
+        self.replaced[self.test_ind] = event
+        return event
+
+
+class CheckpointLoader(StreamLoaderBase):
+    """
+    Stream iterator over the events of the parquet checkpoint saved with StandardDataset.to_checkpoint. Events are
+    read by monthly partitions as the iteration proceeds and partitions before the current batch are released, so
+    the whole dataset is never loaded. Batches are the same as of PullLoader over the dataset loaded from the
+    checkpoint
+
+    :param path: path to the checkpoint folder
+    :param tables: tables with the events. By default all tables of the checkpoint
+    :param batch_size: number of events satisfying the condition in each batch
+    :param condition: function from the event to bool. By default pull requests with at least one reviewer are tested
+    :param mask: vectorized version of the condition. Function from EventStore to boolean array
+    :param from_date: when not None only events after from_date are read
+    :param to_date: when not None only events before to_date are read
+    """
+
+    def __init__(self, path, tables=None, batch_size=1, condition=None, mask=None, from_date=None, to_date=None):
+        # there is no dataset in memory, events are read from the checkpoint by data
+        LoaderBase.__init__(self, None)
+        if condition is None and mask is None:
+            condition, mask = PullLoader._condition, PullLoader._mask
+        meta = read_meta(path)
+        self.path = path
+        self.tables = meta.get('tables', []) if tables is None else tables
+        if meta['format'] != 'parquet' or any(name not in meta.get('partitioned', []) for name in self.tables):
+            raise ValueError(f'{path} is not a parquet checkpoint with monthly partitions. '
+                             f'Save it with to_checkpoint(path, format="parquet")')
+        self.bs = batch_size
+        self.condition = condition
+        self.mask = mask
+        self.from_date = from_date
+        self.to_date = to_date
+        self.dictionaries = read_dictionaries(path, meta)
+        self.partitions = get_stream_partitions(path, self.tables, from_date, to_date)
+        self.data = ChunkedEvents(self.read_chunks)
+        self.tests = None
+
+    def read_chunks(self):
+        """
+        :return: iterator over EventStores of the partitions
+        """
+        for partition in self.partitions:
+            events = {name: read_partition(f'{self.path}/{name}', partition, self.from_date, self.to_date,
+                                           self.dictionaries) for name in self.tables}
+            yield EventStore(events, LIST_COLUMNS)
+
+    def get_tests(self):
+        """
+        :return: iterator over positions of the test events. Next chunk is read when the test events of the loaded
+            chunks are exhausted
+        """
+        cnt = 0
+        while True:
+            try:
+                offset, store = self.data.load()
+            except StopIteration:
+                return
+            if self.mask is None:
+                mask = np.fromiter(map(self.condition, store), dtype=bool, count=len(store))
+            else:
+                mask = np.asarray(self.mask(store), dtype=bool)
+            positions = np.flatnonzero(mask) + offset
+            # the first test event is searched from the third one, as in the event by event iteration
+            positions = positions[positions >= 2]
+            yield from positions[(cnt + np.arange(len(positions))) % self.bs == self.bs - 1].tolist()
+            cnt += len(positions)
+
+    def __iter__(self):
+        self.data.reset()
+        self.tests = self.get_tests()
+        return super().__iter__()
+
+    def __next__(self):
+        """
+        :return: a pair of train and test data. Train data spanning several chunks are returned as a list
+        """
+        from_id = self.ind
+        self.ind = self.get_next()
+        self.data.release(from_id)
+
+        train = self.data[from_id: self.ind + 1]
+        test = self.data[self.ind + 1]
+
+        return train, test
+
+    def get_next(self):
+        return next(self.tests) - 1
+
+    def replace_at(self, ind, rev, event=None):
+        if self.bs != 1:
+            raise NotImplementedError
+        else:
+            return super().replace_at(ind, rev, event)
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from batcore.data.EventStore import EventStore
+
 
 class DatasetBase(ABC):
     """
@@ -19,6 +21,17 @@ class DatasetBase(ABC):
         """
         pass
 
+    def get_events(self, events=None):
+        """
+        time-ordered stream of events. It is built once and shared by the dataset preprocessing and the loaders
+
+        :param events: dict with event tables. Used when the stream is needed before the data is set
+        :return: EventStore with all events sorted by date
+        """
+        if getattr(self, '_events', None) is None:
+            self._events = EventStore(self.data if events is None else events)
+        return self._events
+
     def replace(self, data, cur_rec):
         """
         A method that is used for simulating history
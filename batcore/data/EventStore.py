@@ -0,0 +1,267 @@
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from batcore.data.utils import flatten_lists
+
+# python containers of the list fields that are restored in the rows
+CONTAINERS = {list: list, set: set, tuple: tuple}
+
+
+class EventStore:
+    """
+    columnar storage of the time sorted events. Each field is a typed numpy array over all events, list fields
+    (such as file and reviewer) are stored as a flat array of values with CSR offsets. Rows are restored as dicts
+    only when they are accessed, so indexing and iteration keep the contract of the list of event dicts
+
+    :param events: dict with event tables (pulls, commits and comments dataframes)
+    :param list_fields: names of the list fields. Used for the fields without values, type of other fields is
+        determined by their values
+    """
+
+    def __init__(self, events, list_fields=()):
+        self.tables = list(events)
+        frames = [events[name] for name in self.tables]
+        sizes = [len(df) for df in frames]
+
+        # stable sort, so events with the same date keep the order of the tables and of their rows
+        dates = np.concatenate([df['date'].to_numpy() for df in frames]) if len(frames) else np.empty(0)
+        self.order = np.argsort(dates, kind='stable')
+        self.table_codes = np.repeat(np.arange(len(frames), dtype=np.int8), sizes)[self.order]
+
+        self.fields = {}
+        for name in dict.fromkeys(col for df in frames for col in df.columns):
+            columns = [df[name] if name in df.columns else None for df in frames]
+            first = next((col for col in columns if col is not None and len(col.dropna())), None)
+            sample = None if first is None else first.dropna().iloc[0]
+            if isinstance(sample, (list, set, tuple, np.ndarray)):
+                self.fields[name] = self.list_field(columns, sizes, type(sample))
+            elif sample is None and name in list_fields:
+                self.fields[name] = self.list_field(columns, sizes, list)
+            else:
+                self.fields[name] = self.scalar_field(columns, sizes)
+
+        self.getters = {name: self.getter(name) for name in self.fields}
+        self.table_fields = [[(name, self.getters[name]) for name in df.columns] for df in frames]
+        # boolean masks of the loader conditions over all events
+        self.masks = {}
+
+    def scalar_field(self, columns, sizes):
+        """
+        :return: array with values of all events. Events of the tables without the field get a filler value
+        """
+        dtype = next(col.dtype for col in columns if col is not None)
+        parts = []
+        for col, size in zip(columns, sizes):
+            if col is None:
+                filler = np.empty(size, dtype=dtype if dtype.kind in 'biufM' else object)
+                filler[:] = np.datetime64('NaT') if dtype.kind == 'M' else 0 if dtype.kind in 'biuf' else None
+                parts.append(filler)
+            else:
+                parts.append(col.to_numpy())
+        return np.concatenate(parts)[self.order]
+
+    def list_field(self, columns, sizes, container):
+        """
+        :return: container type, flat array with values of all lists and offsets of the events in it
+        """
+        values, lengths = [], []
+        for col, size in zip(columns, sizes):
+            if col is None:
+                lengths.append(np.zeros(size, dtype=np.int64))
+            elif container is np.ndarray:
+                lengths.append(col.map(len).to_numpy(dtype=np.int64))
+                values += list(col)
+            else:
+                flat, rows = flatten_lists(col)
+                lengths.append(np.bincount(rows, minlength=size).astype(np.int64))
+                values.append(flat)
+
+        if container is np.ndarray:
+            values = np.concatenate(values) if len(values) else np.empty(0, dtype=np.int32)
+        else:
+            values = np.concatenate(values)
+            if pd.api.types.infer_dtype(values, skipna=False) == 'integer':
+                values = values.astype(np.int64)
+
+        lengths = np.concatenate(lengths)
+        starts = np.cumsum(lengths) - lengths
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths[self.order], out=offsets[1:])
+        # position of each value in the unsorted flat array
+        positions = np.repeat(starts[self.order] - offsets[:-1], lengths[self.order]) + np.arange(offsets[-1])
+        return container, values[positions], offsets
+
+    def getter(self, name):
+        """
+        :return: function that restores the value of the field for the event as it was in the table
+        """
+        field = self.fields[name]
+        if isinstance(field, tuple):
+            container, values, offsets = field
+            if container is np.ndarray:
+                return lambda i: values[offsets[i]:offsets[i + 1]]
+            if container is list:
+                return lambda i: values[offsets[i]:offsets[i + 1]].tolist()
+            container = CONTAINERS.get(container, list)
+            return lambda i: container(values[offsets[i]:offsets[i + 1]].tolist())
+        if field.dtype.kind == 'M':
+            return lambda i: pd.Timestamp(field[i])
+        if field.dtype.kind in 'biuf':
+            return lambda i: field[i].item()
+        return field.__getitem__
+
+    def row(self, i):
+        """
+        :return: dict with the fields of the event's table
+        """
+        return {name: get(i) for name, get in self.table_fields[self.table_codes[i]]}
+
+    def column(self, name, start=0, stop=None):
+        """
+        :param name: name of the field
+        :return: view of the field for events from start to stop. For the list fields flat array of values and view
+            of the offsets, values of the event i are values[offsets[i]:offsets[i + 1]]
+        """
+        stop = len(self) if stop is None else stop
+        field = self.fields[name]
+        if isinstance(field, tuple):
+            return field[1], field[2][start:stop + 1]
+        return field[start:stop]
+
+    def view(self):
+        """
+        :return: EventView over all events with its own replaced events
+        """
+        return EventView(self, 0, len(self), {})
+
+    def __len__(self):
+        return len(self.table_codes)
+
+    def __getitem__(self, key):
+        return self.view()[key]
+
+    def __iter__(self):
+        return map(self.row, range(len(self)))
+
+
+class EventView:
+    """
+    zero-copy slice of the EventStore. Behaves as a list of event dicts. Slices of the view are views too
+
+    :param store: EventStore
+    :param start: position of the first event in the store
+    :param stop: position after the last event in the store
+    :param replaced: dict from the position in the store to the event that replaces it. Shared by the slices
+    """
+
+    def __init__(self, store, start, stop, replaced):
+        self.store = store
+        self.start = start
+        self.stop = stop
+        self.replaced = replaced
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError('only slices with step 1 are supported')
+            return EventView(self.store, self.start + start, self.start + max(start, stop), self.replaced)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('event index out of range')
+        i = self.start + key
+        if i in self.replaced:
+            return self.replaced[i]
+        return self.store.row(i)
+
+    def __iter__(self):
+        for i in range(self.start, self.stop):
+            yield self.replaced[i] if i in self.replaced else self.store.row(i)
+
+    def replace(self, key, event):
+        """
+        replaces the event. The replaced event is returned by this view and all views that share its replaced events
+        """
+        self.replaced[self.start + key] = event
+
+    def column(self, name):
+        """
+        :return: view of the field for the events of the view. See EventStore.column
+        """
+        return self.store.column(name, self.start, self.stop)
+
+
+class ChunkedEvents:
+    """
+    stream of events that is read by chunks. Positions of the events are positions in the whole stream, only the
+    loaded chunks are kept in memory. Behaves as a list of event dicts for the loaded events, iteration reads all
+    chunks
+
+    :param read_chunks: function that returns an iterator over EventStores of the consecutive chunks
+    """
+
+    def __init__(self, read_chunks):
+        self.read_chunks = read_chunks
+        self.reset()
+
+    def reset(self):
+        """
+        releases all chunks, so the next chunk to load is the first one
+        """
+        self.chunks = self.read_chunks()
+        # pairs of the position of the first event and the view of the loaded chunks
+        self.loaded = []
+        self.stop = 0
+
+    def load(self):
+        """
+        reads the next chunk. Raises StopIteration when all chunks are read
+
+        :return: position of the first event of the chunk and its EventStore
+        """
+        store = next(self.chunks)
+        start = self.stop
+        self.loaded.append((start, store.view()))
+        self.stop += len(store)
+        return start, store
+
+    def release(self, start):
+        """
+        removes the loaded chunks with all events before start
+        """
+        self.loaded = [(offset, view) for offset, view in self.loaded if offset + len(view) > start]
+
+    def locate(self, i):
+        """
+        :return: position of the first event and view of the loaded chunk with the event i
+        """
+        for offset, view in self.loaded:
+            if offset <= i < offset + len(view):
+                return offset, view
+        raise IndexError('event is not loaded')
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            parts = [view[max(key.start - offset, 0):key.stop - offset] for offset, view in self.loaded
+                     if offset < key.stop and offset + len(view) > key.start]
+            return parts[0] if len(parts) == 1 else list(chain.from_iterable(parts))
+        offset, view = self.locate(key)
+        return view[key - offset]
+
+    def replace(self, key, event):
+        """
+        replaces the event. Events of the released chunks are not read again, so they are not replaced
+        """
+        for offset, view in self.loaded:
+            if offset <= key < offset + len(view):
+                view.replace(key - offset, event)
+
+    def __iter__(self):
+        for store in self.read_chunks():
+            yield from store
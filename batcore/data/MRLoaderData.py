@@ -1,14 +1,104 @@
-import ast
+import hashlib
 import os
+from concurrent.futures import ProcessPoolExecutor
 
-import numpy as np
 import pandas as pd
 
 from batcore.bat_logging import Logger
-from batcore.data.utils import time_interval
+from batcore.data.checkpoint import load_checkpoint, save_checkpoint, get_format, read_meta, write_meta, \
+    read_parquet, write_parquet, write_partitions, changed_partitions, intern_tables, update_dictionaries, \
+    read_dictionaries, write_dictionaries, CHECKPOINT_VERSION
+from batcore.data.cache import get_key, hash_path, load_cache, save_cache
+from batcore.data.utils import time_interval, read_shard, pa_csv, group_unique, map_unique
 
 from datetime import datetime
 
+# tables of the MR-loader output
+TABLES = ['changes', 'changes_files', 'changes_reviewer', 'commits', 'commits_file', 'commits_author',
+          'comments_file', 'comments_patch', 'users']
+
+# tables that are linked to pull requests through commits
+COMMIT_TABLES = ['commits_file', 'commits_author']
+
+# processed tables
+OUTPUT_TABLES = ['pulls', 'commits', 'comments']
+
+# MR-loader tables and their columns needed for each of the processed tables. None stands for all columns
+REQUIREMENTS = {
+    # commits are needed to find authors of the pulls
+    'pulls': {'changes': None, 'changes_files': None, 'changes_reviewer': None,
+              'commits': None, 'commits_file': ['key_commit'], 'commits_author': None},
+    'commits': {'commits': None, 'commits_file': None, 'commits_author': None},
+    'comments': {'comments_file': None, 'comments_patch': None},
+}
+
+COMMITS_COLUMNS = ['key_commit', 'key_change', 'key_file', 'status', 'key_user', 'date']
+COMMENTS_COLUMNS = ['key_user', 'key_change', 'date', 'key_file']
+
+
+def normalize(data):
+    """
+    converts columns of MR-loader tables in place: dates are parsed once and turned to a single timezone, file paths
+    use '/' as a separator, and links are cut from the pull descriptions
+
+    :param data: dictionary with MR-loader dataframes
+    """
+    for table, col in [('commits', 'committed_date'), ('changes', 'created_at'), ('changes', 'updated_time'),
+                       ('comments_file', 'time'), ('comments_patch', 'time')]:
+        if table in data and col in data[table].columns:
+            data[table][col] = pd.to_datetime(data[table][col]).dt.tz_localize(None)
+
+    for table in ['changes_files', 'commits_file', 'comments_file']:
+        if table in data and 'key_file' in data[table].columns:
+            data[table]['key_file'] = map_unique(data[table]['key_file'],
+                                                 lambda x: x.str.replace(':', '/', regex=False))
+
+    if 'changes' in data and 'comment' in data['changes'].columns:
+        # descriptions are mostly unique, plain split is faster than .str methods of object columns
+        data['changes']['comment'] = [x.split('Reviewed-on', 1)[0] for x in data['changes']['comment'].fillna('')]
+
+
+def get_tables(tables):
+    """
+    :param tables: processed tables. Pulls are always processed. When None all tables are processed
+    :return: list of processed tables
+    """
+    if tables is None:
+        return list(OUTPUT_TABLES)
+    for name in tables:
+        if name not in OUTPUT_TABLES:
+            raise ValueError(f'Wrong table {name}. Possible tables are {OUTPUT_TABLES}')
+    return [name for name in OUTPUT_TABLES if name == 'pulls' or name in tables]
+
+
+def required_columns(tables):
+    """
+    :param tables: processed tables
+    :return: dictionary with MR-loader tables and their columns needed to process the tables. None stands for all
+    columns
+    """
+    required = {}
+    for name in tables:
+        for table, columns in REQUIREMENTS[name].items():
+            if table in required and (required[table] is None or columns is None):
+                required[table] = None
+            elif table in required:
+                required[table] = required[table] + [c for c in columns if c not in required[table]]
+            else:
+                required[table] = columns
+    return required
+
+
+def log_reading(log, table, files, frames):
+    """
+    reports number of rows, size and throughput of the read table
+    """
+    rows = sum(len(df) for df, _ in frames)
+    size = sum(os.path.getsize(file_path) for file_path in files) / 2 ** 20
+    read_time = sum(t for _, t in frames)
+    log(f'read {table}: {rows} rows from {len(files)} files ({size:.1f} MB) in {read_time:.2f}s, '
+        f'{size / max(read_time, 1e-9):.1f} MB/s, {rows / max(read_time, 1e-9):.0f} rows/s')
+
 
 class MRLoaderData(Logger):
     """
@@ -20,12 +110,26 @@ class MRLoaderData(Logger):
         :type from_date: datetime.datetime
         :param to_date: all events after to_date are removed from the data
         :type to_date: datetime.datetime
+        :param n_jobs: number of processes used to read csv files
+        :param csv_engine: csv reader. 'pandas', 'pyarrow', or 'auto' (pyarrow when it is installed)
+        :param tables: processed tables, subset of ['pulls', 'commits', 'comments']. Pulls are always processed. Only
+            csv files needed for these tables are read, the rest of the tables are left empty. When None all tables
+            are processed
+        :param intern: when True each distinct user and file is stored once and shared by all rows of pulls, commits,
+            and comments. Checkpoints of such dataset keep users and files as int32 codes of the shared dictionaries
+        :param cache_dir: folder with processed datasets. When csv files with the same content were already processed
+            with the same parameters, the result is loaded from the cache
        """
 
     def __init__(self,
                  path=None,
                  from_date=None,
                  to_date=None,
+                 n_jobs=1,
+                 csv_engine='auto',
+                 tables=None,
+                 intern=False,
+                 cache_dir=None,
                  verbose=False,
                  log_file_path=None,
                  log_stdout=False,
@@ -33,122 +137,187 @@ class MRLoaderData(Logger):
                  ):
 
         self.setup_logger(verbose, log_file_path, log_stdout, log_mode)
-        if path is not None:
-            self.from_date = from_date
-            self.to_date = to_date
+        self.from_date = from_date
+        self.to_date = to_date
+        self.tables = get_tables(tables)
+        self.intern = intern
+        if path is not None and cache_dir is not None:
+            cache_key = get_key(type(self).__name__, hash_path(path),
+                                {'from_date': from_date, 'to_date': to_date, 'tables': self.tables, 'intern': intern})
+            state = load_cache(cache_dir, cache_key)
+            if state is not None:
+                self.pulls, self.commits, self.comments = state['pulls'], state['commits'], state['comments']
+                self.info(f"loaded from cache {cache_dir}/{cache_key}")
+                return
 
+        if path is not None:
             self.info(f"loading gerrit data from {path}")
-            data = MRLoaderData.get_df(path)
+            data = MRLoaderData.get_df(path, n_jobs, csv_engine, log=self.info, tables=required_columns(self.tables))
             self.info(f"processing data")
-            self.pulls, self.commits, self.comments = self.prepare(data)
+            self.pulls, self.commits, self.comments = self.prepare(data, self.tables)
             self.info(f"additional processing for the pull request")
             self.prepare_pulls()
+            if 'commits' not in self.tables:
+                self.commits = pd.DataFrame(columns=COMMITS_COLUMNS)
+            if self.intern:
+                intern_tables({'pulls': self.pulls, 'commits': self.commits, 'comments': self.comments})
+            if cache_dir is not None:
+                save_cache(cache_dir, cache_key, {'pulls': self.pulls, 'commits': self.commits,
+                                                  'comments': self.comments})
             self.info(f"finished processing the data")
 
     @staticmethod
-    def get_df(path):
+    def get_shards(path, tables=None):
         """
-        reading all the csv files from MR-loader
         :param path: path to the directory with csv files
-        :return: dictionary with all dataframes for pulls, commits, and comments
+        :param tables: tables to look for. When None all tables are used
+        :return: dictionary with list of csv files for each of the tables
         """
-        data = {}
-        for d in ['changes', 'changes_files', 'changes_reviewer', 'commits', 'commits_file', 'commits_author',
-                  'comments_file', 'comments_patch', 'users']:
-            cur_data = []
+        shards = {}
+        for d in (TABLES if tables is None else tables):
+            shards[d] = []
             for root, subdirs, files in os.walk(path + f'/{d}'):
                 for file in files:
-                    file_path = os.path.join(root, file)
                     if file.endswith('.csv'):
-                        cur_data.append(
-                            pd.read_csv(file_path, sep='|'))  # todo remove on bad lines
-            data[d] = pd.concat(cur_data, axis=0).reset_index()
+                        shards[d].append(os.path.join(root, file))
+        return shards
+
+    @staticmethod
+    def read_shards(shards, n_jobs=1, csv_engine='auto', columns=None):
+        """
+        reads csv files from MR-loader
+        :param shards: dictionary with list of csv files for each of the tables
+        :param n_jobs: number of processes used to read csv files. Files are read sequentially when n_jobs=1
+        :param csv_engine: csv reader. 'pandas', 'pyarrow', or 'auto' (pyarrow when it is installed)
+        :param columns: dictionary with columns to read for each of the tables. Missing tables and None values stand
+            for all columns
+        :return: dictionary with list of (dataframe, reading time) pairs for each of the tables
+        """
+        if csv_engine == 'auto':
+            use_arrow = pa_csv is not None
+        elif csv_engine == 'pyarrow':
+            if pa_csv is None:
+                raise ImportError("csv_engine='pyarrow' requires pyarrow to be installed")
+            use_arrow = True
+        elif csv_engine == 'pandas':
+            use_arrow = False
+        else:
+            raise ValueError(f'Wrong csv_engine {csv_engine}')
+
+        columns = {} if columns is None else columns
+        if n_jobs == 1:
+            return {d: [read_shard(file_path, use_arrow, columns.get(d)) for file_path in shards[d]] for d in shards}
+
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            # all files are submitted at once so that small tables do not wait for the big ones
+            futures = {d: [executor.submit(read_shard, file_path, use_arrow, columns.get(d)) for file_path in shards[d]]
+                       for d in shards}
+            return {d: [future.result() for future in futures[d]] for d in futures}
+
+    @staticmethod
+    def get_df(path, n_jobs=1, csv_engine='auto', log=None, tables=None):
+        """
+        reading all the csv files from MR-loader
+        :param path: path to the directory with csv files
+        :param n_jobs: number of processes used to read csv files. Files are read sequentially when n_jobs=1
+        :param csv_engine: csv reader. 'pandas', 'pyarrow', or 'auto' (pyarrow when it is installed)
+        :param log: function that receives reading statistics for each of the tables
+        :param tables: list of tables to read or dictionary with columns to read for each of the tables (None stands
+            for all columns). When None all tables are read
+        :return: dictionary with all dataframes for pulls, commits, and comments
+        """
+        columns = tables if isinstance(tables, dict) else None
+        shards = MRLoaderData.get_shards(path, tables)
+        frames = MRLoaderData.read_shards(shards, n_jobs, csv_engine, columns)
+
+        data = {}
+        for d in shards:
+            data[d] = pd.concat([df for df, _ in frames[d]], axis=0).reset_index()  # todo remove on bad lines
+            if log is not None:
+                log_reading(log, d, shards[d], frames[d])
         print('loaded')
         return data
 
-    def prepare(self, data):
+    def prepare(self, data, tables=OUTPUT_TABLES):
         """
         processing the data
         :param data: dictionary with all dataframes
+        :param tables: processed tables. Only authors of the pulls are found in commits when commits are not processed.
+            Comments are left empty when they are not processed
         :return: pulls and commits dataframes with all mined features
         """
-        # commits part
+        # unify timezone, paths and descriptions
+        normalize(data)
 
-        # unify timezone
-        data['commits']['committed_date'] = pd.to_datetime(data['commits'].committed_date).dt.tz_localize(None)
+        # commits part
 
         # remove commits not in the timeframe
         data['commits'] = data['commits'][
             time_interval(data['commits']['committed_date'], self.from_date, self.to_date)]
 
-        # add authors
-        commits = data['commits'].merge(data['commits_file'],
-                                        left_on='key_commit',
-                                        right_on='key_commit').merge(data['commits_author'],
-                                                                     left_on='key_commit',
-                                                                     right_on='key_commit')
-
-        commits['date'] = pd.to_datetime(commits.committed_date).dt.tz_localize(None)
-
-        # remove some columns
-        commits = commits.drop(
-            ['oid', 'index_x', 'index_y', 'index', 'committed_date', 'lines_inserted', 'lines_deleted', 'size',
-             'size_delta', 'uploader_key_user', 'committer_key_user', 'status'], axis=1)
-        # re-format files paths
-        commits['key_file'] = commits['key_file'].apply(lambda x: x.replace(':', '/'))
-
-        commits = commits.rename({'author_key_user': 'key_user'}, axis=1)
+        if 'commits' in tables:
+            # add authors
+            commits = data['commits'].merge(data['commits_file'],
+                                            left_on='key_commit',
+                                            right_on='key_commit').merge(data['commits_author'],
+                                                                         left_on='key_commit',
+                                                                         right_on='key_commit')
+
+            commits['date'] = commits.committed_date
+
+            # remove some columns
+            commits = commits.drop(
+                ['oid', 'index_x', 'index_y', 'index', 'committed_date', 'lines_inserted', 'lines_deleted', 'size',
+                 'size_delta', 'uploader_key_user', 'committer_key_user', 'status'], axis=1)
+            commits = commits.rename({'author_key_user': 'key_user'}, axis=1)
+        else:
+            # only authors of the pulls are needed. commits without files are skipped as in the full processing
+            commits = data['commits'][data['commits'].key_commit.isin(data['commits_file'].key_commit)]
+            commits = commits[['key_commit', 'key_change']].merge(
+                data['commits_author'][['key_commit', 'author_key_user']], on='key_commit')
+            commits = commits.rename({'author_key_user': 'key_user'}, axis=1)
 
         # pulls part
 
-        # remove duplicates and unify time
+        # remove duplicates
         data['changes_reviewer'] = data['changes_reviewer'].drop_duplicates()
         data['changes_files'] = data['changes_files'].drop_duplicates()
         data['changes'] = data['changes'].drop_duplicates()
-        data['changes']['created_at'] = pd.to_datetime(data['changes'].created_at).dt.tz_localize(None)
 
         # remove pulls not in the time frame
         data['changes'] = data['changes'][time_interval(data['changes']['created_at'], self.from_date, self.to_date)]
 
-        # add more fields
-        pulls = data['changes'].merge(data['changes_files'],
-                                      left_on='key_change',
-                                      right_on='key_change', how='inner').merge(data['changes_reviewer'],
-                                                                                left_on='key_change',
-                                                                                right_on='key_change',
-                                                                                how='inner')
+        # files and reviewers are aggregated for each pull separately and joined to the pulls once. joining them
+        # directly produces a row for each (file, reviewer) pair of the pull
+        files = group_unique(data['changes_files'], 'key_change', 'key_file')
+        reviewers = group_unique(data['changes_reviewer'], 'key_change', 'key_user')
 
-        # data cleaning
-        pulls = pulls.drop(
-            ['index_x', 'index_y', 'index'], axis=1)
+        pulls = data['changes'].join(files.rename('file_path'), on='key_change', how='inner').join(
+            reviewers.rename('reviewer_login'), on='key_change', how='inner')
 
-        pulls['updated_at'] = pd.to_datetime(pulls.updated_time).dt.tz_localize(None)
-        pulls['created_at'] = pd.to_datetime(pulls.created_at).dt.tz_localize(None)
+        # data cleaning
+        pulls = pulls.drop(['index'], axis=1)
 
-        # reformatting and renaming
-        pulls['key_file'] = pulls['key_file'].apply(lambda x: x.replace(':', '/'))
-        pulls = pulls.rename(
-            {'key_file': 'file_path', 'subject': 'body', 'key_user_y': 'reviewer_login', 'key': 'number',
-             'key_user_x': 'owner'}, axis=1)
+        pulls['updated_at'] = pulls.updated_time
 
-        pulls.comment = pulls.comment.fillna('')
-        pulls['comment'] = pulls.comment.apply(lambda x: x.split('Reviewed-on')[0])
+        # renaming
+        pulls = pulls.rename({'subject': 'body', 'key': 'number', 'key_user': 'owner'}, axis=1)
 
         # comments part
-        comments_file = data['comments_file']
-        comments_file.time = pd.to_datetime(comments_file.time).dt.tz_localize(None)
-        comments_file = comments_file[time_interval(comments_file.time, self.from_date, self.to_date)]
-        comments_file = comments_file.drop(['index'], axis=1).rename({'time': 'date'}, axis=1)
-        comments_file['key_file'] = comments_file['key_file'].apply(lambda x: x.replace(':', '/'))
+        if 'comments' in tables:
+            comments_file = data['comments_file']
+            comments_file = comments_file[time_interval(comments_file.time, self.from_date, self.to_date)]
+            comments_file = comments_file.drop(['index'], axis=1).rename({'time': 'date'}, axis=1)
 
-        comments_pull = data['comments_patch']
-        comments_pull.time = pd.to_datetime(comments_pull.time).dt.tz_localize(None)
-        comments_pull = comments_pull[time_interval(comments_pull.time, self.from_date, self.to_date)]
+            comments_pull = data['comments_patch']
+            comments_pull = comments_pull[time_interval(comments_pull.time, self.from_date, self.to_date)]
 
-        comments_pull = comments_pull.drop(['index', 'oid'], axis=1).rename({'time': 'date'}, axis=1)
-        comments_pull['key_file'] = None
+            comments_pull = comments_pull.drop(['index', 'oid'], axis=1).rename({'time': 'date'}, axis=1)
+            comments_pull['key_file'] = None
 
-        comments = pd.concat((comments_pull, comments_file), axis=0).reset_index().drop(['index'], axis=1)
+            comments = pd.concat((comments_pull, comments_file), axis=0).reset_index().drop(['index'], axis=1)
+        else:
+            comments = pd.DataFrame(columns=COMMENTS_COLUMNS)
 
         return pulls, commits, comments
 
@@ -167,67 +336,202 @@ class MRLoaderData(Logger):
              'reviewer_login': 'reviewer',
              'file_path': 'file'}, axis=1)
 
-        # group entries by pulls and aggregates reviewers
-        self.pulls = self.pulls.groupby('key_change')[
-            ['file', 'reviewer', 'date', 'owner', 'title', 'status', 'closed']].agg(
-            {'file': lambda x: list(set(x)),
-             'reviewer': lambda x: list(set(x)),
-             'date': lambda x: list(x)[0],
-             'owner': lambda x: list(set(x)),
-             'title': lambda x: list(x)[0],
-             'status': lambda x: list(x)[0],
-             'closed': lambda x: list(x)[0]}).reset_index()
+        # group entries by pulls. fields are taken from the first entry of the pull, owners are aggregated.
+        # groupby().first() is not used as it skips missing values
+        owners = group_unique(self.pulls, 'key_change', 'owner')
+        self.pulls = self.pulls.drop_duplicates('key_change').sort_values('key_change', kind='stable')
+        self.pulls = self.pulls.drop('owner', axis=1).join(owners, on='key_change', how='inner')
+        self.pulls = self.pulls[['key_change', 'file', 'reviewer', 'date', 'owner', 'title', 'status',
+                                 'closed']].reset_index(drop=True)
 
         self.pulls['title'] = self.pulls['title'].fillna('')
 
         # get contributor for each of the pull from the commits and add them to the pulls
-        pull_authors = self.commits.groupby('key_change').agg({'key_user': lambda x: set(x)}).reset_index()
-        pull_authors = pull_authors.rename({'key_user': 'author'}, axis=1)
-        self.pulls = self.pulls.merge(pull_authors, on='key_change', how='left')
+        pull_authors = group_unique(self.commits, 'key_change', 'key_user', container=set)
+        self.pulls = self.pulls.join(pull_authors.rename('author'), on='key_change')
 
     def from_checkpoint(self, path):
-        self.pulls = pd.read_csv(path + '/pulls.csv', index_col=0)
-        self.pulls.date = pd.to_datetime(self.pulls.date).dt.tz_localize(None)
-
-        self.pulls.file = self.pulls.file.apply(ast.literal_eval)
-        self.pulls.reviewer = self.pulls.reviewer.apply(ast.literal_eval)
-
-        self.pulls.owner = self.pulls.owner.apply(lambda x: ast.literal_eval(x) if x is not np.nan else [])
-        self.pulls.author = self.pulls.author.apply(lambda x: ast.literal_eval(x) if x is not np.nan else [])
-
-        self.pulls = self.pulls.fillna('')
+        """
+        loads dataset saved with to_checkpoint. Only data within [from_date; to_date] and only processed tables are
+        loaded
 
-        try:
-            self.pulls.reviewer = self.pulls.reviewer.apply(lambda x: [int(i) for i in x])
-            self.pulls.author = self.pulls.author.apply(
-                lambda x: [int(i) for i in x])
-        except ValueError:
-            pass
+        :param path: path to the checkpoint folder
+        """
+        interned = len(read_meta(path).get('dictionaries', [])) > 0
+        data = load_checkpoint(path, self.tables, self.from_date, self.to_date)
+        self.pulls = data['pulls']
 
-        if os.path.isfile(path + '/commits.csv'):
-            self.commits = pd.read_csv(path + '/commits.csv', index_col=0)
-            self.commits.date = pd.to_datetime(self.commits.date).dt.tz_localize(None)
+        if 'commits' in data:
+            self.commits = data['commits']
         else:
-            self.commits = pd.DataFrame(columns=['key_commit', 'key_change', 'key_file', 'status', 'key_user', 'date'])
+            self.commits = pd.DataFrame(columns=COMMITS_COLUMNS)
 
-        if os.path.isfile(path + '/comments.csv'):
-            self.comments = pd.read_csv(path + '/comments.csv', index_col=0)
-            self.comments.date = pd.to_datetime(self.comments.date).dt.tz_localize(None)
+        if 'comments' in data:
+            self.comments = data['comments']
         else:
-            self.commits = pd.DataFrame(columns=['key_user', 'key_change', 'date', 'key_file'])
+            self.comments = pd.DataFrame(columns=COMMENTS_COLUMNS)
+
+        # users and files of the interned checkpoints are already shared
+        if self.intern and not interned:
+            intern_tables({'pulls': self.pulls, 'commits': self.commits, 'comments': self.comments})
+        self.intern = self.intern or interned
 
         return self
 
-    def to_checkpoint(self, path):
+    def to_checkpoint(self, path, format='auto'):
         """
         saves dataset
 
         :param path: path to the folder to save results
+        :param format: checkpoint format. 'parquet', 'csv' or 'auto' (parquet when pyarrow is installed)
         """
+        save_checkpoint(path, {'pulls': self.pulls, 'commits': self.commits, 'comments': self.comments}, format,
+                        intern=self.intern)
 
-        if not os.path.exists(path):
-            os.makedirs(path)
+    def update(self, path, checkpoint_path, n_jobs=1, csv_engine='auto'):
+        """
+        incrementally adds output of MR-loader to the checkpoint. Only new or changed csv files are read and only
+        affected tables of the checkpoint are rewritten. Parsed csv files are kept in the checkpoint folder, so pull
+        requests that span old and new files are aggregated the same way as during the full processing. When the
+        checkpoint does not exist or was saved with to_checkpoint (so it has no record of the read files), it is
+        rebuilt from all the files and the following updates are incremental
 
-        self.pulls.to_csv(path + '/pulls.csv')
-        self.commits.to_csv(path + '/commits.csv')
-        self.comments.to_csv(path + '/comments.csv')
+        :param path: path to the directory with csv files
+        :param checkpoint_path: path to the checkpoint folder
+        :param n_jobs: number of processes used to read csv files
+        :param csv_engine: csv reader. 'pandas', 'pyarrow', or 'auto' (pyarrow when it is installed)
+        :return: self with the updated data
+        """
+        get_format('parquet')
+        meta = read_meta(checkpoint_path) if os.path.isdir(checkpoint_path) else {'format': None}
+        manifest = meta.get('shards', {})
+        dates = {'from_date': None if self.from_date is None else str(self.from_date),
+                 'to_date': None if self.to_date is None else str(self.to_date)}
+        if len(manifest) and (meta['from_date'], meta['to_date']) != (dates['from_date'], dates['to_date']):
+            raise ValueError(f"Checkpoint {checkpoint_path} was built for dates "
+                             f"{meta['from_date']} - {meta['to_date']}")
+
+        # find new and changed files
+        shards = self.get_shards(path)
+        files = {}
+        for d in shards:
+            for file_path in shards[d]:
+                name = os.path.relpath(file_path, path)
+                stat = os.stat(file_path)
+                files[name] = {'table': d,
+                               'size': stat.st_size,
+                               'mtime': stat.st_mtime_ns,
+                               'cache': f'shards/{d}/{hashlib.sha1(name.encode()).hexdigest()[:16]}.parquet'}
+        new = [name for name in files if name not in manifest or
+               (manifest[name]['size'], manifest[name]['mtime']) != (files[name]['size'], files[name]['mtime'])]
+        removed = [name for name in manifest if name not in files or name in new]
+        self.info(f'{len(new)} new or changed files, {len([name for name in manifest if name not in files])} '
+                  f'removed files')
+
+        if not len(new) and not len(removed):
+            return self.from_checkpoint(checkpoint_path)
+
+        # everything that was contributed by the old versions of files and by the new files is recalculated
+        changed = {d: [] for d in TABLES}
+        for name in removed:
+            changed[manifest[name]['table']].append(read_parquet(f"{checkpoint_path}/{manifest[name]['cache']}"))
+            os.remove(f"{checkpoint_path}/{manifest[name]['cache']}")
+
+        new_names = {d: [name for name in new if files[name]['table'] == d] for d in TABLES}
+        frames = self.read_shards({d: [os.path.join(path, name) for name in new_names[d]] for d in TABLES},
+                                  n_jobs, csv_engine)
+        for d in TABLES:
+            if len(new_names[d]):
+                log_reading(self.info, d, [os.path.join(path, name) for name in new_names[d]], frames[d])
+            for name, (df, _) in zip(new_names[d], frames[d]):
+                # index is kept as during the full processing
+                df = df.reset_index()
+                os.makedirs(os.path.dirname(f"{checkpoint_path}/{files[name]['cache']}"), exist_ok=True)
+                write_parquet(df, f"{checkpoint_path}/{files[name]['cache']}")
+                changed[d].append(df)
+
+        # pull requests that have rows in the changed files
+        commit_changes = pd.concat([df[['key_commit', 'key_change']] for df in changed['commits']] +
+                                   [read_parquet(f"{checkpoint_path}/{files[name]['cache']}",
+                                                 columns=['key_commit', 'key_change'])
+                                    for name in files if files[name]['table'] == 'commits'])
+        keys = set()
+        for d in TABLES:
+            for df in changed[d]:
+                if d in COMMIT_TABLES:
+                    keys.update(commit_changes[commit_changes.key_commit.isin(df.key_commit)].key_change)
+                elif d != 'users':
+                    keys.update(df.key_change)
+        keys = list(keys)
+
+        # new checkpoints are interned according to the dataset, existing ones keep their layout
+        dictionaries = read_dictionaries(checkpoint_path, meta) if len(manifest) else {} if self.intern else None
+        partitioned = meta.get('partitioned', [])
+        meta = {'format': 'parquet',
+                'version': CHECKPOINT_VERSION,
+                'tables': ['pulls', 'commits', 'comments'],
+                'partitioned': partitioned,
+                'dictionaries': list(dictionaries or []),
+                'shards': files,
+                **dates}
+        if not len(keys):
+            write_meta(checkpoint_path, meta)
+            return self.from_checkpoint(checkpoint_path)
+
+        # raw data of the affected pull requests in the same order as during the full processing
+        data = {}
+        for d in TABLES:
+            if d == 'users':
+                continue
+            if d in COMMIT_TABLES:
+                filters = [('key_commit', 'in', list(data['commits'].key_commit))]
+            else:
+                filters = [('key_change', 'in', keys)]
+            data[d] = pd.concat([read_parquet(f"{checkpoint_path}/{files[name]['cache']}", filters=filters)
+                                 for name in files if files[name]['table'] == d], ignore_index=True)
+
+        self.info(f'processing {len(keys)} affected pull requests')
+        self.pulls, self.commits, self.comments = self.prepare(data)
+        self.prepare_pulls()
+
+        # dictionaries are only extended, so codes in the partitions that are not rewritten stay valid
+        if dictionaries is not None:
+            dictionaries = update_dictionaries({'pulls': self.pulls, 'commits': self.commits,
+                                                'comments': self.comments}, dictionaries)
+            write_dictionaries(checkpoint_path, dictionaries)
+            meta['dictionaries'] = list(dictionaries)
+
+        # rows of the affected pull requests are replaced. Kept rows preserve their index, so only months with
+        # replaced or moved rows are rewritten
+        old = load_checkpoint(checkpoint_path, ['pulls', 'commits', 'comments']) if len(manifest) else {}
+        tables = {'pulls': self.pulls, 'commits': self.commits, 'comments': self.comments}
+        for name in tables:
+            if name in old:
+                keep = old[name][~old[name].key_change.isin(keys)]
+                if len(keep) == len(old[name]) and not len(tables[name]) and name in partitioned:
+                    tables[name] = old[name]
+                    continue
+                start = old[name].index.max() + 1 if len(old[name]) else 0
+                tables[name].index = pd.RangeIndex(start, start + len(tables[name]))
+                tables[name] = pd.concat([keep, tables[name]])
+            if name == 'pulls':
+                tables[name] = tables[name].sort_values('key_change', kind='stable').reset_index(drop=True)
+
+            if name in partitioned and name in old:
+                partitions = changed_partitions(old[name], tables[name], keys)
+                self.info(f'rewriting {len(partitions)} partitions of {name}')
+                write_partitions(tables[name], f'{checkpoint_path}/{name}', partitions, dictionaries)
+            else:
+                # checkpoints without the manifest (e.g. saved with to_checkpoint) are rebuilt from all files
+                self.info(f'rewriting {name}')
+                write_partitions(tables[name].reset_index(drop=True), f'{checkpoint_path}/{name}',
+                                 dictionaries=dictionaries)
+                if name not in partitioned:
+                    partitioned.append(name)
+        self.pulls, self.commits, self.comments = tables['pulls'], tables['commits'], tables['comments']
+        if dictionaries is not None:
+            self.intern = True
+            intern_tables(tables)
+
+        write_meta(checkpoint_path, meta)
+        return self
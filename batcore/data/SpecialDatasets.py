@@ -1,35 +1,37 @@
 import pandas as pd
 
 from batcore.data.StandardDataset import StandardDataset
-from .utils import ItemMap
-from .utils import get_all_reviewers, get_all_words
+from .utils import ItemMap, flatten_lists
+from .utils import get_all_reviewers, get_encoded_reviewers, get_title_tokens
 
 
 class RevFinderDataset(StandardDataset):
     def additional_preprocessing(self, events):
-        data = []
-        for event_type in events:
-            data += events[event_type].to_dict('records')
-        data = sorted(data, key=lambda x: x['date'])
+        data = self.get_events(events)
+        if self.encoded:
+            self.reviewers = get_encoded_reviewers(data, self.users)
+            return
         self.reviewers = get_all_reviewers(data)
+        self.itemize_paths(events)
 
     def get_items2ids(self):
-        ret = {'reviewers': self.reviewers}
+        ret = super().get_items2ids()
+        ret['reviewers'] = self.reviewers
         return ret
 
 
 class RevRecDataset(StandardDataset):
     def additional_preprocessing(self, events):
+        if self.encoded:
+            return
+        self.itemize_paths(events)
         self.users = ItemMap()
-        data = []
-        for event_type in events:
-            data += events[event_type].to_dict('records')
-        data = sorted(data, key=lambda x: x['date'])
+        data = self.get_events(events)
         for event in data:
             if event['type'] == 'pull':
                 for rev in event['reviewer']:
                     self.users.add2(rev)
-        for user in pd.unique(events['pulls']['owner'].sum()):
+        for user in pd.unique(flatten_lists(events['pulls']['owner'])[0]):
             self.users.add2(user)
 
         for user in pd.unique(events['comments']['key_user']):
@@ -42,15 +44,19 @@ class RevRecDataset(StandardDataset):
 
 class TieDataset(StandardDataset):
     def additional_preprocessing(self, events):
-        data = []
-        for event_type in events:
-            data += events[event_type].to_dict('records')
-        data = sorted(data, key=lambda x: x['date'])
+        # titles are tokenized once, so Tie does not split them on every fit and predict
+        self.words, tokens = get_title_tokens(events['pulls']['title'], self.n_jobs)
+        events['pulls'] = events['pulls'].assign(title_tokens=tokens)
+        data = self.get_events(events)
 
-        self.reviewers = get_all_reviewers(data)
-        self.words = get_all_words(data)
+        if self.encoded:
+            self.reviewers = get_encoded_reviewers(data, self.users)
+        else:
+            self.reviewers = get_all_reviewers(data)
+            self.itemize_paths(events)
 
     def get_items2ids(self):
-        ret = {'reviewer_list': self.reviewers,
-               'word_list': self.words}
+        ret = super().get_items2ids()
+        ret.update({'reviewer_list': self.reviewers,
+                    'word_list': self.words})
         return ret
@@ -1,4 +1,3 @@
-import os
 from copy import deepcopy
 
 import numpy as np
@@ -6,8 +5,9 @@ import pandas as pd
 
 from batcore.bat_logging import Logger
 from batcore.data.DatasetBase import DatasetBase
-from batcore.data.utils import ItemMap, preprocess_users, add_self_review
-import ast
+from batcore.data.cache import get_key, hash_path, hash_dataset, load_cache, save_cache
+from batcore.data.checkpoint import load_checkpoint, save_checkpoint
+from batcore.data.utils import ItemMap, PathTable, preprocess_users, copy_dataset, flatten_lists, unflatten_arrays
 
 
 class StandardDataset(DatasetBase, Logger):
@@ -21,6 +21,8 @@ class StandardDataset(DatasetBase, Logger):
     :param user_items: if True user2id map is created
     :param file_items: if True file2id map is created
     :param pull_items: if true pull2id map is created
+    :param path_items: if True table of interned file paths is created. It is always created for RevFinderDataset,
+        RevRecDataset, TieDataset and the encoded datasets
     :param owner_policy: how pull owners are calculated.
         * None - owners are unchanged
         * author - commit authors of the pull are treated as owners
@@ -32,6 +34,15 @@ class StandardDataset(DatasetBase, Logger):
     :param bots: strategy for bot identification in user factorization. When 'auto' bots will be determined automatically. Otherwise, path to the csv with bot accounts should be specified
     :param project_name: name of the project for automatic bot detection
     :param self_review_flag: when true adds a column to the pulls dataframe which signifies that there was a self-review (based on the users aliases)
+    :param encoded: when True users, files and pulls in the events are replaced with dense int32 ids. Lists of them
+        become int32 arrays and missing files get -1. Maps for decoding are returned by get_items2ids
+    :param checkpoint_path: path to the checkpoint saved with to_checkpoint. When specified, dataset is ignored
+    :param from_date: when loading from the checkpoint only events after from_date are loaded
+    :param to_date: when loading from the checkpoint only events before to_date are loaded
+    :param cache_dir: folder with processed datasets. When the same input (checkpoint content or dataset tables) was
+        already processed with the same parameters, events and item maps are loaded from the cache.
+        Automatically detected bots and matched aliases are cached there too
+    :param n_jobs: number of processes used for the alias matching and the tokenization of the titles
     """
 
     def __init__(self,
@@ -42,6 +53,7 @@ class StandardDataset(DatasetBase, Logger):
                  user_items=False,
                  file_items=False,
                  pull_items=False,
+                 path_items=False,
                  remove_empty=False,
                  owner_policy='author_owner_fallback',
                  remove='none',
@@ -52,7 +64,12 @@ class StandardDataset(DatasetBase, Logger):
                  bots='auto',
                  project_name='',
                  self_review_flag=False,
+                 encoded=False,
                  checkpoint_path=None,
+                 from_date=None,
+                 to_date=None,
+                 cache_dir=None,
+                 n_jobs=1,
                  verbose=False,
                  log_file_path=None,
                  log_stdout=False,
@@ -61,11 +78,35 @@ class StandardDataset(DatasetBase, Logger):
 
         self.setup_logger(verbose, log_file_path, log_stdout, log_mode)
 
+        cache_key = None
+        if cache_dir is not None:
+            args = {'max_file': max_file, 'commits': commits, 'comments': comments, 'user_items': user_items,
+                    'file_items': file_items, 'pull_items': pull_items, 'path_items': path_items,
+                    'remove_empty': remove_empty,
+                    'owner_policy': owner_policy, 'remove': remove, 'process_users': process_users,
+                    'factorize_users': factorize_users, 'alias': alias, 'remove_bots': remove_bots, 'bots': bots,
+                    'project_name': project_name, 'self_review_flag': self_review_flag, 'encoded': encoded,
+                    'from_date': from_date, 'to_date': to_date}
+            if process_users and remove_bots and bots != 'auto':
+                args['bots'] = hash_path(bots)
+            data_hash = hash_path(checkpoint_path) if checkpoint_path is not None else hash_dataset(dataset)
+            cache_key = get_key(type(self).__name__, data_hash, args)
+
+            state = load_cache(cache_dir, cache_key)
+            if state is not None:
+                self.__dict__.update(state)
+                self.info(f'loaded from cache {cache_dir}/{cache_key}')
+                return
+
         self.checkpoint = checkpoint_path is not None
+        self.encoded = encoded
+        self.n_jobs = n_jobs
         self.bad_pulls = None
         self.max_file = max_file
         self.commits = commits
         self.comments = comments
+        self.from_date = from_date
+        self.to_date = to_date
 
         if checkpoint_path is not None:
             self.info(f'loading from checkpoint {checkpoint_path}')
@@ -74,19 +115,12 @@ class StandardDataset(DatasetBase, Logger):
         if remove == 'none':
             remove = ['owner']
 
-        dataset = deepcopy(dataset)
+        # the source dataset is never changed. Only frames are copied, values in the cells are shared
+        dataset = copy_dataset(dataset)
         if process_users:
             self.info(f'starting processing users')
-            if self_review_flag:
-                dataset_alias = deepcopy(dataset)
-                preprocess_users(dataset_alias, remove_bots, bots, factorize_users, True, project_name, threshold=0.1)
-
-            if self_review_flag and alias:
-                dataset = dataset_alias
-            else:
-                preprocess_users(dataset, remove_bots, bots, factorize_users, alias, project_name, threshold=0.1)
-            if self_review_flag:
-                add_self_review(dataset_alias, dataset)
+            preprocess_users(dataset, remove_bots, bots, factorize_users, alias, project_name, threshold=0.1,
+                             cache_dir=cache_dir, n_jobs=n_jobs, self_review=self_review_flag)
             self.info(f'finished processing users')
 
         self.user_items = user_items
@@ -101,6 +135,9 @@ class StandardDataset(DatasetBase, Logger):
         if self.pull_items:
             self.pulls = None
 
+        self.path_items = path_items
+        self.paths = None
+
         self.owner_policy = owner_policy
         self.remove = remove
         self.remove_empty = remove_empty
@@ -108,6 +145,11 @@ class StandardDataset(DatasetBase, Logger):
         self.info(f'processing all data')
         super().__init__(dataset)
 
+        if cache_key is not None:
+            save_cache(cache_dir, cache_key, {k: v for k, v in self.__dict__.items()
+                                              if k not in ['verbose', 'logger', '_events']})
+            self.info(f'saved to cache {cache_dir}/{cache_key}')
+
     def preprocess(self, dataset):
         """
         :param dataset: GerritLoader-like dataset
@@ -128,9 +170,55 @@ class StandardDataset(DatasetBase, Logger):
         else:
             events = self.data
 
+        if self.encoded:
+            events = self.encode(events)
         self.additional_preprocessing(events)
         return events
 
+    def encode(self, events):
+        """
+        replaces users, files and pulls with their ids. Reviewers get the first ids, so ids from 0 to n_reviewers - 1
+        can be used as indices of the reviewers. They are ordered by the first appearance in the time-ordered stream
+
+        :param events: dict with pulls, commits and comments dataframes
+        :return: dict with encoded dataframes
+        """
+        pulls = events['pulls']
+        tables = [events[name] for name in ['commits', 'comments'] if name in events]
+
+        flat = {col: flatten_lists(pulls[col]) for col in ['reviewer', 'owner', 'author', 'file']}
+        # pulls are stably sorted by date in the stream
+        values, rows = flat['reviewer']
+        rank = np.empty(len(pulls), dtype=np.int64)
+        rank[np.argsort(pulls['date'].to_numpy(), kind='stable')] = np.arange(len(pulls))
+        reviewers = pd.unique(values[np.argsort(rank[rows], kind='stable')])
+        self.users = ItemMap(np.concatenate([reviewers] + [flat[col][0] for col in ['owner', 'author']] +
+                                            [df['key_user'].to_numpy(dtype=object) for df in tables]))
+        self.n_reviewers = len(reviewers)
+        self.pulls = ItemMap(np.concatenate([df['key_change'].to_numpy(dtype=object) for df in [pulls] + tables]))
+        files = [df['key_file'].dropna().to_numpy(dtype=object) for df in tables if 'key_file' in df]
+        self.files = ItemMap(np.concatenate([flat['file'][0]] + files))
+
+        self.paths = PathTable(self.files)
+
+        maps = {'reviewer': self.users, 'owner': self.users, 'author': self.users, 'file': self.files}
+        encoded = {'pulls': pulls.assign(key_change=self.pulls.getids(pulls['key_change']).astype(np.int32),
+                                         **{col: unflatten_arrays(maps[col].getids(values), rows, len(pulls))
+                                            for col, (values, rows) in flat.items()})}
+        for name in ['commits', 'comments']:
+            if name not in events:
+                continue
+            df = events[name]
+            columns = {'key_change': self.pulls.getids(df['key_change']).astype(np.int32),
+                       'key_user': self.users.getids(df['key_user']).astype(np.int32)}
+            if 'key_file' in df:
+                files = np.full(len(df), -1, dtype=np.int32)
+                known = df['key_file'].notna().to_numpy()
+                files[known] = self.files.getids(df['key_file'][known])
+                columns['key_file'] = files
+            encoded[name] = df.assign(**columns)
+        return encoded
+
     def get_pulls(self, dataset):
         """
         :param dataset: GerritLoader-like dataset
@@ -208,12 +296,12 @@ class StandardDataset(DatasetBase, Logger):
         user_list = []
         if 'pulls' in events:
             pulls = events['pulls']
-            user_list += pulls['reviewer'].sum() + pulls['owner'].sum()
+            user_list += [flatten_lists(pulls['reviewer'])[0], flatten_lists(pulls['owner'])[0]]
         if 'comments' in events:
-            user_list += events['comments']['key_user'].to_list()
+            user_list.append(events['comments']['key_user'].to_numpy(dtype=object))
         if 'commits' in events:
-            user_list += events['commits']['key_user'].to_list()
-        self.users = ItemMap(user_list)
+            user_list.append(events['commits']['key_user'].to_numpy(dtype=object))
+        self.users = ItemMap(np.concatenate(user_list) if len(user_list) else None)
 
         # if 'pulls' in events:
         # pulls = events['pulls']
@@ -234,18 +322,32 @@ class StandardDataset(DatasetBase, Logger):
         """
         creates file2id map from events
         """
-        self.files = ItemMap(events['pulls']['file'].sum())
+        self.files = ItemMap(flatten_lists(events['pulls']['file'])[0])
+
+    def itemize_paths(self, events):
+        """
+        creates table of interned paths for the files of all events
+        """
+        files = [flatten_lists(events['pulls']['file'])[0]]
+        files += [events[name]['key_file'].dropna().to_numpy(dtype=object) for name in ['commits', 'comments']
+                  if name in events and 'key_file' in events[name]]
+        self.paths = PathTable(ItemMap(np.concatenate(files)))
 
     def additional_preprocessing(self, events):
         """
         creates all item2id maps
         """
+        if self.encoded:
+            # maps are created with the encoding
+            return
         if self.user_items:
             self.itemize_users(events)
         if self.pull_items:
             self.itemize_pulls(events)
         if self.file_items:
             self.itemize_files(events)
+        if self.path_items:
+            self.itemize_paths(events)
 
     def replace(self, data, rev):
         data = deepcopy(data)
@@ -256,55 +358,40 @@ class StandardDataset(DatasetBase, Logger):
 
     def get_items2ids(self):
         ret = {}
+        if self.encoded:
+            ret = {'users': self.users, 'pulls': self.pulls, 'files': self.files, 'paths': self.paths,
+                   'n_reviewers': self.n_reviewers, 'encoded': True}
+            return ret
         if self.user_items:
             ret['users'] = self.users
         if self.pull_items:
             ret['pulls'] = self.pulls
         if self.file_items:
             ret['files'] = self.files
+        if self.paths is not None:
+            ret['paths'] = self.paths
         return ret
 
     def from_checkpoint(self, path):
+        """
+        loads preprocessed events saved with to_checkpoint
 
-        self.data = {}
-        self.data['pulls'] = pd.read_csv(path + '/pulls.csv', index_col=0)
-
-        self.data['pulls'].date = pd.to_datetime(self.data['pulls'].date).dt.tz_localize(None)
-
-        self.data['pulls'].file = self.data['pulls'].file.apply(ast.literal_eval)
-        self.data['pulls'].reviewer = self.data['pulls'].reviewer.apply(ast.literal_eval)
-
-        self.data['pulls'].owner = self.data['pulls'].owner.apply(
-            lambda x: ast.literal_eval(x) if x is not np.nan else [])
-        self.data['pulls'].author = self.data['pulls'].author.apply(
-            lambda x: ast.literal_eval(x) if x is not np.nan else [])
-
-        self.data['pulls'] = self.data['pulls'].fillna('')
-
-        try:
-            self.data['pulls'].reviewer = self.data['pulls'].reviewer.apply(lambda x: [int(i) for i in x])
-            self.data['pulls'].author = self.data['pulls'].author.apply(lambda x: [int(i) for i in x])
-        except ValueError:
-            pass
-
+        :param path: path to the checkpoint folder
+        """
+        tables = ['pulls']
         if self.commits:
-            self.data['commits'] = pd.read_csv(path + '/commits.csv', index_col=0)
-            self.data['commits'].date = pd.to_datetime(self.data['commits'].date).dt.tz_localize(None)
-
+            tables.append('commits')
         if self.comments:
-            self.data['comments'] = pd.read_csv(path + '/comments.csv', index_col=0)
-            self.data['comments'].date = pd.to_datetime(self.data['comments'].date).dt.tz_localize(None)
+            tables.append('comments')
+        self.data = load_checkpoint(path, tables, self.from_date, self.to_date)
 
-    def to_checkpoint(self, path):
+    def to_checkpoint(self, path, format='auto'):
         """
         saves dataset
 
         :param path: path to the folder to save results
+        :param format: checkpoint format. 'parquet', 'csv' or 'auto' (parquet when pyarrow is installed)
         """
-
-        if not os.path.exists(path):
-            os.makedirs(path)
-
-        self.data['pulls'].to_csv(path + '/pulls.csv')
-        self.data['commits'].to_csv(path + '/commits.csv')
-        self.data['comments'].to_csv(path + '/comments.csv')
+        if self.encoded:
+            raise ValueError('encoded datasets can not be saved. Save the dataset created with encoded=False')
+        save_checkpoint(path, self.data, format)
@@ -1,4 +1,5 @@
 from .DatasetBase import DatasetBase
+from .EventStore import ChunkedEvents, EventStore, EventView
 from .MRLoaderData import MRLoaderData
 from .SpecialDatasets import RevRecDataset, RevFinderDataset, TieDataset
 from .StandardDataset import StandardDataset
@@ -7,6 +8,9 @@ from .aggregators import *
 
 __all__ = [
     "DatasetBase",
+    "EventStore",
+    "EventView",
+    "ChunkedEvents",
     "MRLoaderData",
     "RevRecDataset",
     "RevFinderDataset",
@@ -17,5 +21,9 @@ __all__ = [
     "StreamUntilConditionLoader",
     "PullLoader",
     "PullLoaderAliasTest",
+    "TimeWindowLoader",
+    "PrefetchLoader",
+    "CheckpointLoader",
     "get_gerrit_dataset",
+    "get_required_tables",
 ]
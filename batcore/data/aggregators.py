@@ -1,7 +1,6 @@
 from copy import deepcopy
 
 from batcore.data import StandardDataset, RevRecDataset, TieDataset, RevFinderDataset
-from batcore.baselines import *
 
 default_args = {'max_file': 50,
                 'commits': False,
@@ -32,6 +31,7 @@ def get_gerrit_dataset(
         pull_items=None,
         owner_policy=None,
         remove=None,
+        encoded=None,
         model_cls=None):
     """
     returns a dataset object with specified attributes or default dataset for the specified model
@@ -48,6 +48,8 @@ def get_gerrit_dataset(
         * author_no_na - commit authors of the pull are treated as owners. pulls without an author are removed
         * author_owner_fallback - if pull has author, owner field set to the author. Otherwise, nothing is done
     :param remove: list of columns to remove from the reviewers. Can be a subset of ['owner', 'author']
+    :param encoded: if True users, files and pulls are replaced with their ids. Supported by CN, RevRec, WRC, RevFinder
+        and Tie
     :param model_cls: class implementing RecommenderBase interface or None. When class is specified suitable Dataset
     will be returned
     """
@@ -58,36 +60,79 @@ def get_gerrit_dataset(
               'file_items': file_items,
               'pull_items': pull_items,
               'owner_policy': owner_policy,
-              'remove': remove}
+              'remove': remove,
+              'encoded': encoded}
 
     remove_nones(kwargs)
     data_args = deepcopy(default_args)
     data_args.update(kwargs)
 
-    if issubclass(model_cls, RevFinder):
-        return RevFinderDataset(dataset, **data_args)
+    dataset_cls, data_args = get_dataset_args(model_cls, data_args)
+    return dataset_cls(dataset, **data_args)
+
+
+def get_dataset_args(model_cls, data_args):
+    """
+    :param model_cls: class implementing RecommenderBase interface or None
+    :param data_args: arguments of the dataset
+    :return: dataset class suitable for the model and its arguments
+    """
+    # imported here since the baselines use the path table of batcore.data
+    from batcore.baselines import ACRec, CN, RevFinder, RevRec, Tie, WRC, cHRev, xFinder
+
+    # models that can work with the encoded datasets
+    encoded_models = (CN, RevRec, WRC, RevFinder, Tie)
+    if data_args.get('encoded', False) and (model_cls is None or not issubclass(model_cls, encoded_models)):
+        name = None if model_cls is None else model_cls.__name__
+        raise ValueError(f'encoded=True is supported only for {", ".join(cls.__name__ for cls in encoded_models)}, '
+                         f'got model_cls={name}')
+    if model_cls is None:
+        return StandardDataset, data_args
+    elif issubclass(model_cls, RevFinder):
+        return RevFinderDataset, data_args
     elif issubclass(model_cls, ACRec):
         data_args['comments'] = True
-        return StandardDataset(dataset, **data_args)
+        return StandardDataset, data_args
     elif issubclass(model_cls, CN):
         data_args['comments'] = True
         data_args['user_items'] = True
-        return StandardDataset(dataset, **data_args)
+        return StandardDataset, data_args
     elif issubclass(model_cls, RevRec):
         data_args['comments'] = True
         data_args['user_items'] = True
-        return RevRecDataset(dataset, **data_args)
+        return RevRecDataset, data_args
     elif issubclass(model_cls, Tie):
-        return TieDataset(dataset, **data_args)
+        return TieDataset, data_args
     elif issubclass(model_cls, WRC):
         data_args['user_items'] = True
         data_args['file_items'] = True
-        return StandardDataset(dataset, **data_args)
+        data_args['path_items'] = True
+        return StandardDataset, data_args
     elif issubclass(model_cls, cHRev):
         data_args['comments'] = True
-        return StandardDataset(dataset, **data_args)
+        return StandardDataset, data_args
     elif issubclass(model_cls, xFinder):
         data_args['commits'] = True
-        return StandardDataset(dataset, **data_args)
+        return StandardDataset, data_args
     else:
-        return StandardDataset(dataset, **data_args)
+        return StandardDataset, data_args
+
+
+def get_required_tables(model_cls=None, commits=None, comments=None):
+    """
+    returns tables of MRLoaderData that are used by the dataset of the model. Can be passed to MRLoaderData to skip
+    reading and processing of the rest
+    :param model_cls: class implementing RecommenderBase interface or None
+    :param commits: if False commits are omitted from the data
+    :param comments: if False comments are omitted from the data
+    :return: list of tables
+    """
+    kwargs = {'commits': commits,
+              'comments': comments}
+
+    remove_nones(kwargs)
+    data_args = deepcopy(default_args)
+    data_args.update(kwargs)
+
+    _, data_args = get_dataset_args(model_cls, data_args)
+    return ['pulls'] + [name for name in ['commits', 'comments'] if data_args[name]]
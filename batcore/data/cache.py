@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import pickle
+
+import pandas as pd
+
+# version of the cached state. it is increased when processing changes, so old entries are not used
+CACHE_VERSION = 1
+
+# folders of the checkpoint that do not affect loaded data
+SKIPPED_FOLDERS = ['shards']
+
+
+def get_key(*parts):
+    """
+    :param parts: json serializable parts of the key (strings, numbers, lists and dicts of them)
+    :return: hex digest identifying the parts
+    """
+    return hashlib.sha1(json.dumps([CACHE_VERSION, *parts], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def hash_path(path):
+    """
+    :param path: path to a file or a folder
+    :return: hash of the names and contents of all files
+    """
+    h = hashlib.sha1()
+    if os.path.isfile(path):
+        files = [path]
+        root = os.path.dirname(path)
+    else:
+        root = path
+        files = []
+        for cur, subdirs, names in os.walk(path):
+            subdirs[:] = sorted(d for d in subdirs if os.path.relpath(os.path.join(cur, d), path) not in SKIPPED_FOLDERS)
+            files += [os.path.join(cur, name) for name in sorted(names)]
+
+    for file_path in files:
+        h.update(os.path.relpath(file_path, root).encode())
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_frame(df):
+    """
+    :return: hash of the dataframe content. Sets are sorted, so the hash does not depend on the hash seed
+    """
+    h = hashlib.sha1()
+    h.update(str([(col, str(dtype)) for col, dtype in df.dtypes.items()]).encode())
+    # columns are expected to hold values of a single type, so the first value is checked
+    lists = [col for col in df.columns if df[col].dtype == object and
+             isinstance(next(iter(df[col].dropna()), None), (list, set, tuple))]
+    if len(lists):
+        df = df.assign(**{col: df[col].map(lambda x: str(sorted(x, key=str)) if isinstance(x, set) else
+                                           str(list(x)) if isinstance(x, (list, tuple)) else x) for col in lists})
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes() if len(df.columns) else b'')
+    return h.hexdigest()
+
+
+def hash_dataset(dataset, tables=('pulls', 'commits', 'comments')):
+    """
+    :param dataset: GerritLoader-like object
+    :return: hash of the dataset tables
+    """
+    return get_key({name: hash_frame(getattr(dataset, name)) for name in tables
+                    if isinstance(getattr(dataset, name, None), pd.DataFrame)})
+
+
+def load_cache(cache_dir, key):
+    """
+    :return: cached state or None when there is no entry for the key
+    """
+    file_path = f'{cache_dir}/{key}.pkl'
+    if not os.path.isfile(file_path):
+        return None
+    with open(file_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_cache(cache_dir, key, state):
+    """
+    saves state to the cache. The file is written under a temporary name first, so concurrent runs never read
+    partially written entries
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{cache_dir}/{key}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, f'{cache_dir}/{key}.pkl')
@@ -0,0 +1,512 @@
+import ast
+import json
+import os
+import shutil
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# version of the checkpoint layout. it is increased when the layout changes in an incompatible way
+# 1 - a parquet file for each table
+# 2 - tables with dates are split into monthly parquet files
+# 3 - users and files can be stored as int32 codes of the shared dictionaries
+CHECKPOINT_VERSION = 3
+
+# columns with lists of files and users
+LIST_COLUMNS = ['file', 'reviewer', 'owner', 'author']
+
+# columns with users and files. Interned checkpoints store them as int32 codes of the dictionaries
+DICTIONARY_COLUMNS = {'key_user': 'users', 'reviewer': 'users', 'owner': 'users', 'author': 'users',
+                      'key_file': 'files', 'file': 'files'}
+
+# key of the parquet schema metadata with the columns of numpy arrays. Other list columns are read as python lists
+ARRAY_COLUMNS_KEY = b'batcore.array_columns'
+
+# tables with this column are partitioned by month
+PARTITION_COLUMN = 'date'
+# partition for rows without date
+UNKNOWN_PARTITION = 'unknown'
+
+
+def get_format(format):
+    """
+    :param format: checkpoint format. 'parquet', 'csv' or 'auto' (parquet when pyarrow is installed)
+    :return: checkpoint format that will be used
+    """
+    if format == 'auto':
+        return 'csv' if pq is None else 'parquet'
+    if format == 'parquet' and pq is None:
+        raise ImportError("format='parquet' requires pyarrow to be installed")
+    if format not in ['csv', 'parquet']:
+        raise ValueError(f'Wrong checkpoint format {format}')
+    return format
+
+
+def read_meta(path):
+    """
+    :param path: path to the checkpoint folder
+    :return: checkpoint description. Checkpoints without description are treated as csv checkpoints
+    """
+    if not os.path.isfile(path + '/meta.json'):
+        return {'format': 'csv', 'version': 0}
+    with open(path + '/meta.json') as f:
+        meta = json.load(f)
+    if meta['version'] > CHECKPOINT_VERSION:
+        raise ValueError(f"Checkpoint {path} has version {meta['version']}, "
+                         f"only versions up to {CHECKPOINT_VERSION} are supported")
+    return meta
+
+
+def write_meta(path, meta):
+    with open(path + '/meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def save_checkpoint(path, tables, format='auto', intern=False):
+    """
+    saves dataframes into the checkpoint folder. In parquet checkpoints tables with dates are split into monthly
+    files, so loading of a date range reads only the overlapping months
+
+    :param path: path to the folder to save results
+    :param tables: dict with dataframes. Keys are used as names of the files
+    :param format: checkpoint format. 'parquet', 'csv' or 'auto' (parquet when pyarrow is installed)
+    :param intern: when True users and files are stored as int32 codes of the dictionaries saved in the checkpoint.
+        Only for parquet format
+    """
+    format = get_format(format)
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    dictionaries = None
+    if intern and format == 'parquet':
+        dictionaries = update_dictionaries(tables)
+        write_dictionaries(path, dictionaries)
+
+    partitioned = []
+    for name, df in tables.items():
+        if format == 'parquet' and PARTITION_COLUMN in df.columns:
+            # order of the rows is restored from the index
+            if not df.index.is_monotonic_increasing or not df.index.is_unique:
+                df = df.reset_index(drop=True)
+            write_partitions(df, f'{path}/{name}', dictionaries=dictionaries)
+            partitioned.append(name)
+        elif format == 'parquet':
+            write_parquet(df, f'{path}/{name}.parquet', dictionaries)
+        else:
+            df.to_csv(f'{path}/{name}.csv')
+
+    write_meta(path, {'format': format, 'version': CHECKPOINT_VERSION, 'tables': list(tables),
+                      'partitioned': partitioned, 'dictionaries': list(dictionaries or [])})
+
+
+def load_checkpoint(path, tables, from_date=None, to_date=None):
+    """
+    loads dataframes from the checkpoint folder. Format of the checkpoint is determined automatically
+
+    :param path: path to the checkpoint folder
+    :param tables: names of the tables to load. Tables that are not present in the checkpoint are skipped
+    :param from_date: when not None only rows with later dates are loaded
+    :param to_date: when not None only rows with earlier dates are loaded
+    :return: dict with loaded dataframes
+    """
+    meta = read_meta(path)
+    dictionaries = read_dictionaries(path, meta)
+    data = {}
+    for name in tables:
+        if name in meta.get('partitioned', []):
+            data[name] = read_partitions(f'{path}/{name}', from_date, to_date, dictionaries)
+            continue
+
+        if meta['format'] == 'parquet':
+            if not os.path.isfile(f'{path}/{name}.parquet'):
+                continue
+            data[name] = read_parquet(f'{path}/{name}.parquet', dictionaries=dictionaries)
+        elif os.path.isfile(f'{path}/{name}.csv'):
+            data[name] = read_csv(f'{path}/{name}.csv')
+        else:
+            continue
+
+        if (from_date is not None or to_date is not None) and PARTITION_COLUMN in data[name].columns:
+            data[name] = data[name][date_filter(data[name][PARTITION_COLUMN], from_date, to_date)]
+    return data
+
+
+def date_filter(col, from_date, to_date):
+    """
+    :return: mask of the rows which lie within [from_date; to_date]
+    """
+    mask = col.notna()
+    if from_date is not None:
+        mask &= col >= pd.Timestamp(from_date)
+    if to_date is not None:
+        mask &= col <= pd.Timestamp(to_date)
+    return mask
+
+
+def get_partitions(dates):
+    """
+    :param dates: datetime column
+    :return: name of the monthly partition for each date
+    """
+    return dates.dt.strftime('%Y-%m').fillna(UNKNOWN_PARTITION)
+
+
+def changed_partitions(old, new, keys):
+    """
+    finds partitions that differ after rows of some pull requests are replaced. Both tables should keep index of the
+    rows that were not replaced
+
+    :param old: table before the replacement
+    :param new: table after the replacement
+    :param keys: replaced pull requests
+    :return: list of partitions to rewrite
+    """
+    partitions = set()
+    for df in [old, new]:
+        partitions.update(get_partitions(df.loc[df.key_change.isin(keys), PARTITION_COLUMN]))
+
+    # rows that moved to other positions
+    rows = [pd.DataFrame({'partition': get_partitions(df[PARTITION_COLUMN]).to_numpy(),
+                          'row': df.index.to_numpy(),
+                          'key_change': df.key_change.to_numpy()}) for df in [old, new]]
+    moved = rows[0].merge(rows[1], how='outer', indicator=True)
+    partitions.update(moved.loc[moved['_merge'] != 'both', 'partition'])
+    return sorted(partitions)
+
+
+def write_partitions(df, path, partitions=None, dictionaries=None):
+    """
+    saves dataframe into a folder with a parquet file for each month. Index of the dataframe is saved to restore the
+    order of rows
+
+    :param df: dataframe with PARTITION_COLUMN
+    :param path: path to the folder of the table
+    :param partitions: partitions to write. When None the whole table is rewritten
+    :param dictionaries: when not None users and files are saved as codes of the dictionaries
+    """
+    if partitions is None:
+        shutil.rmtree(path, ignore_errors=True)
+    if os.path.isfile(path + '.parquet'):
+        os.remove(path + '.parquet')
+    os.makedirs(path, exist_ok=True)
+
+    names = get_partitions(df[PARTITION_COLUMN])
+    written = set()
+    for partition, part in df.groupby(names.to_numpy(), sort=True):
+        if partitions is None or partition in partitions:
+            write_parquet(part, f'{path}/{partition}.parquet', dictionaries)
+        written.add(partition)
+    if not len(df):
+        # empty table keeps its columns
+        write_parquet(df, f'{path}/{UNKNOWN_PARTITION}.parquet', dictionaries)
+        written.add(UNKNOWN_PARTITION)
+
+    # partitions that became empty
+    for partition in partitions or []:
+        if partition not in written and os.path.isfile(f'{path}/{partition}.parquet'):
+            os.remove(f'{path}/{partition}.parquet')
+
+
+def read_partitions(path, from_date=None, to_date=None, dictionaries=None):
+    """
+    loads dataframe saved with write_partitions. Only partitions overlapping with [from_date; to_date] are read
+
+    :param path: path to the folder of the table
+    :param from_date: when not None only rows with later dates are loaded
+    :param to_date: when not None only rows with earlier dates are loaded
+    :param dictionaries: dictionaries used to save the partitions
+    :return: dataframe with rows in the saved order
+    """
+    files = sorted(os.listdir(path))
+    frames = []
+    for file in files:
+        if overlaps(file[:-len('.parquet')], from_date, to_date):
+            frames.append(read_parquet(f'{path}/{file}', dictionaries=dictionaries))
+
+    if not len(frames):
+        return to_pandas(pq.read_schema(f'{path}/{files[0]}').empty_table(), dictionaries)
+    df = pd.concat(frames).sort_index(kind='stable')
+    if from_date is not None or to_date is not None:
+        df = df[date_filter(df[PARTITION_COLUMN], from_date, to_date)]
+    return df
+
+
+def overlaps(partition, from_date=None, to_date=None):
+    """
+    :return: True when the monthly partition overlaps with [from_date; to_date]. Partition of the rows without date
+        overlaps only with the unbounded interval
+    """
+    if partition == UNKNOWN_PARTITION:
+        return from_date is None and to_date is None
+    start = pd.Timestamp(partition)
+    if from_date is not None and start + pd.DateOffset(months=1) <= pd.Timestamp(from_date):
+        return False
+    return to_date is None or start <= pd.Timestamp(to_date)
+
+
+def get_stream_partitions(path, tables, from_date=None, to_date=None):
+    """
+    :param path: path to the checkpoint folder
+    :param tables: names of the partitioned tables
+    :return: sorted monthly partitions of the tables that overlap with [from_date; to_date]. Partition of the rows
+        without date is the last one, as these rows are the last in the time-ordered stream
+    """
+    partitions = {file[:-len('.parquet')] for name in tables for file in os.listdir(f'{path}/{name}')}
+    partitions = sorted(p for p in partitions if p != UNKNOWN_PARTITION and overlaps(p, from_date, to_date))
+    if overlaps(UNKNOWN_PARTITION, from_date, to_date):
+        partitions.append(UNKNOWN_PARTITION)
+    return partitions
+
+
+def read_partition(path, partition, from_date=None, to_date=None, dictionaries=None):
+    """
+    loads one partition of the dataframe saved with write_partitions
+
+    :param path: path to the folder of the table
+    :param partition: name of the partition. When the table has no such partition, empty dataframe is returned
+    :param from_date: when not None only rows with later dates are loaded
+    :param to_date: when not None only rows with earlier dates are loaded
+    :param dictionaries: dictionaries used to save the partitions
+    :return: dataframe with rows in the saved order
+    """
+    if not os.path.isfile(f'{path}/{partition}.parquet'):
+        file = sorted(os.listdir(path))[0]
+        return to_pandas(pq.read_schema(f'{path}/{file}').empty_table(), dictionaries)
+    df = read_parquet(f'{path}/{partition}.parquet', dictionaries=dictionaries).sort_index(kind='stable')
+    if from_date is not None or to_date is not None:
+        df = df[date_filter(df[PARTITION_COLUMN], from_date, to_date)]
+    return df
+
+
+def write_parquet(df, file_path, dictionaries=None):
+    """
+    saves dataframe to a parquet file. Lists and sets are stored as parquet list columns. Columns of numpy arrays
+    are listed in the schema metadata, so they are read back as arrays
+
+    :param dictionaries: when not None users and files are saved as int32 codes of the dictionaries
+    """
+    encoded = [col for col in df.columns if dictionaries is not None and col in DICTIONARY_COLUMNS]
+    arrays = [col for col in df.columns if col not in encoded and
+              isinstance(next((x for x in df[col] if x is not None), None), np.ndarray)]
+    lists = {col: [list(x) if isinstance(x, (list, set, tuple, np.ndarray)) else [] for x in df[col]]
+             for col in LIST_COLUMNS if col in df.columns and col not in encoded}
+    if len(lists):
+        df = df.assign(**lists)
+
+    table = pa.Table.from_pandas(df.drop(encoded, axis=1))
+    for col in encoded:
+        codes, offsets = encode_column(df[col], dictionaries[DICTIONARY_COLUMNS[col]])
+        if offsets is None:
+            array = pa.array(codes, mask=codes < 0)
+        else:
+            array = pa.ListArray.from_arrays(pa.array(offsets), pa.array(codes))
+        table = table.add_column(list(df.columns).index(col), col, array)
+    if len(arrays):
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), ARRAY_COLUMNS_KEY: json.dumps(arrays)})
+    pq.write_table(table, file_path)
+
+
+def read_parquet(file_path, columns=None, filters=None, dictionaries=None):
+    """
+    loads dataframe from a parquet file. List columns are decoded into python lists without per-row parsing
+
+    :param columns: columns to read. When None all columns are read
+    :param filters: row filters in pyarrow format (e.g. [('key_change', 'in', keys)])
+    :param dictionaries: dictionaries used to save the file
+    """
+    return to_pandas(pq.read_table(file_path, columns=columns, filters=filters), dictionaries)
+
+
+def to_pandas(table, dictionaries=None):
+    """
+    :param table: pyarrow table
+    :param dictionaries: when not None users and files are decoded from codes of the dictionaries
+    :return: dataframe with list columns decoded into python lists or into numpy arrays for the columns saved from
+        arrays
+    """
+    encoded = [col for col in table.column_names if dictionaries is not None and col in DICTIONARY_COLUMNS]
+    list_columns = [field.name for field in table.schema if pa.types.is_list(field.type) and field.name not in encoded]
+    arrays = json.loads((table.schema.metadata or {}).get(ARRAY_COLUMNS_KEY, b'[]'))
+    df = table.drop(list_columns + encoded).to_pandas()
+    for col in list_columns:
+        df[col] = to_arrays(table.column(col)) if col in arrays else to_lists(table.column(col))
+    for col in encoded:
+        column = table.column(col).combine_chunks()
+        if pa.types.is_list(column.type):
+            codes, offsets = column.values.to_numpy(), column.offsets.to_numpy()
+        else:
+            codes, offsets = column.fill_null(-1).to_numpy(), None
+        df[col] = decode_column(codes, offsets, dictionaries[DICTIONARY_COLUMNS[col]])
+    columns = [col for col in table.column_names if col in df.columns]
+    return df[columns]
+
+
+def to_lists(column):
+    """
+    :param column: pyarrow array with lists
+    :return: list with python list for each of the rows. Missing values are turned into empty lists
+    """
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    values = column.values.to_numpy(zero_copy_only=False).tolist()
+    offsets = column.offsets.to_numpy()
+    return [values[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def to_arrays(column):
+    """
+    :param column: pyarrow array with lists
+    :return: object array with numpy array for each of the rows. Missing values are turned into empty arrays
+    """
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    values = column.values.to_numpy(zero_copy_only=False)
+    offsets = column.offsets.to_numpy()
+    result = np.empty(len(column), dtype=object)
+    for i, (start, end) in enumerate(zip(offsets[:-1].tolist(), offsets[1:].tolist())):
+        result[i] = values[start:end]
+    return result
+
+
+def flatten(col):
+    """
+    :param col: column with lists or sets. Missing values are treated as empty lists
+    :return: array with all values and int32 offsets of the rows
+    """
+    rows = [x if isinstance(x, (list, set, tuple, np.ndarray)) else () for x in col]
+    offsets = np.zeros(len(rows) + 1, dtype=np.int32)
+    np.cumsum([len(x) for x in rows], out=offsets[1:])
+    values = np.empty(offsets[-1], dtype=object)
+    values[:] = list(chain.from_iterable(rows))
+    return values, offsets
+
+
+def get_values(col):
+    """
+    :return: array with not missing values of the column. Values of the list columns are flattened
+    """
+    if col.name in LIST_COLUMNS:
+        return flatten(col)[0]
+    return col.dropna().to_numpy(dtype=object)
+
+
+def update_dictionaries(tables, dictionaries=None):
+    """
+    collects users and files from the tables
+
+    :param tables: dict with dataframes
+    :param dictionaries: existing dictionaries. New values are appended to them, so existing codes stay valid
+    :return: dict with pd.Index of values for each of the dictionaries
+    """
+    dictionaries = {} if dictionaries is None else dict(dictionaries)
+    for name in sorted(set(DICTIONARY_COLUMNS.values())):
+        values = [get_values(df[col]) for df in tables.values() for col in df.columns
+                  if DICTIONARY_COLUMNS.get(col) == name]
+        new = pd.Index(pd.unique(np.concatenate(values)) if len(values) else [], dtype=object)
+        old = dictionaries.get(name, pd.Index([], dtype=object))
+        dictionaries[name] = old.append(new[~new.isin(old)])
+    return dictionaries
+
+
+def write_dictionaries(path, dictionaries):
+    os.makedirs(f'{path}/dictionaries', exist_ok=True)
+    for name, dictionary in dictionaries.items():
+        pq.write_table(pa.table({'value': pa.array(dictionary.to_numpy(), pa.string())}),
+                       f'{path}/dictionaries/{name}.parquet')
+
+
+def read_dictionaries(path, meta):
+    """
+    :return: dictionaries of the checkpoint or None when the checkpoint is not interned
+    """
+    if not len(meta.get('dictionaries', [])):
+        return None
+    return {name: pd.Index(pq.read_table(f'{path}/dictionaries/{name}.parquet').column('value').to_pylist(),
+                           dtype=object)
+            for name in meta['dictionaries']}
+
+
+def encode_column(col, dictionary):
+    """
+    :param col: column with values or lists of values
+    :param dictionary: pd.Index with all values of the column
+    :return: int32 codes of the values and int32 offsets of the rows for the list columns (None for other columns).
+        Missing values have code -1
+    """
+    if col.name in LIST_COLUMNS:
+        values, offsets = flatten(col)
+        return dictionary.get_indexer(values).astype(np.int32), offsets
+    return dictionary.get_indexer(col.to_numpy(dtype=object)).astype(np.int32), None
+
+
+def decode_column(codes, offsets, dictionary):
+    """
+    :param codes: codes of the values
+    :param offsets: offsets of the rows for the list columns, otherwise None
+    :param dictionary: pd.Index with values
+    :return: list with values or lists of values for each row. Equal values are the same python objects
+    """
+    values = dictionary.to_numpy()
+    if offsets is None:
+        result = values[codes] if len(values) else np.empty(len(codes), dtype=object)
+        result[codes < 0] = None
+        return result
+    values = values[codes].tolist()
+    return [values[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def intern_tables(tables):
+    """
+    replaces users and files in the tables with shared python objects, so each distinct value is stored once
+
+    :param tables: dict with dataframes. Dataframes are changed in place
+    :return: dictionaries with all users and files
+    """
+    dictionaries = update_dictionaries(tables)
+    for df in tables.values():
+        for col in df.columns:
+            if col not in DICTIONARY_COLUMNS:
+                continue
+            codes, offsets = encode_column(df[col], dictionaries[DICTIONARY_COLUMNS[col]])
+            values = decode_column(codes, offsets, dictionaries[DICTIONARY_COLUMNS[col]])
+            if offsets is None:
+                # missing values are kept as they were
+                values[codes < 0] = df[col].to_numpy(dtype=object)[codes < 0]
+            else:
+                values = [type(x)(v) if isinstance(x, (set, tuple)) else v if isinstance(x, (list, np.ndarray)) else x
+                          for x, v in zip(df[col], values)]
+            df[col] = pd.Series(values, index=df.index, dtype=object)
+    return dictionaries
+
+
+def read_csv(file_path):
+    """
+    loads dataframe from a csv file. List columns are parsed from their string representation
+    """
+    df = pd.read_csv(file_path, index_col=0)
+    if 'date' in df.columns:
+        df.date = pd.to_datetime(df.date).dt.tz_localize(None)
+
+    if 'file' not in df.columns:
+        return df
+
+    df.file = df.file.apply(ast.literal_eval)
+    df.reviewer = df.reviewer.apply(ast.literal_eval)
+
+    df.owner = df.owner.apply(lambda x: ast.literal_eval(x) if x is not np.nan else [])
+    df.author = df.author.apply(lambda x: ast.literal_eval(x) if x is not np.nan else [])
+
+    df = df.fillna('')
+
+    try:
+        df.reviewer = df.reviewer.apply(lambda x: [int(i) for i in x])
+        df.author = df.author.apply(lambda x: [int(i) for i in x])
+    except ValueError:
+        pass
+    return df
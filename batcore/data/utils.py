@@ -1,42 +1,190 @@
+import copy
+import csv
+import functools
+import itertools
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
 from nltk import LancasterStemmer
 
+from batcore.data.cache import get_key, load_cache, save_cache
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa = None
+    pc = None
+    pa_csv = None
 
-from aliasmatching import BirdMatching
-# from batcore.alias.utils import get_clusters
+# values that pandas csv reader parses as booleans
+TRUE_VALUES = ['True', 'TRUE', 'true']
+FALSE_VALUES = ['False', 'FALSE', 'false']
 
 stemmer = LancasterStemmer()
 
 
 class ItemMap:
+    """
+    map between items and their ids. Ids are given in order of the first appearance of the items
+
+    Items are stored in a numpy array that grows geometrically. Single items are looked up with a dict and arrays of
+    items with pandas Index
+
+    :param data: iterable or array of items. Repeated items get the id of the first appearance
+    """
+
     def __init__(self, data=None):
         if data is None:
-            self.id2item = []
-            self.item2id = {}
+            items = np.empty(0, dtype=object)
         else:
-            self.id2item = list(dict.fromkeys(data))
-            self.item2id = {item: i for (i, item) in enumerate(self.id2item)}
+            if not isinstance(data, (np.ndarray, pd.Series, pd.Index)):
+                data = pd.Series(list(data), dtype=object)
+            # numbers are converted to python objects as in the lists
+            items = pd.unique(data).astype(object)
+
+        self.size = len(items)
+        self.array = np.empty(max(self.size, 16), dtype=object)
+        self.array[:self.size] = items
+        self.item2id = dict(zip(items.tolist(), range(self.size)))
+        self.index = None
+
+    @property
+    def id2item(self):
+        """
+        :return: array of items ordered by their ids
+        """
+        return self.array[:self.size]
 
     def __getitem__(self, i):
         return self.id2item[i]
 
+    def __contains__(self, item):
+        return item in self.item2id
+
     def getid(self, item):
         return self.item2id[item]
 
+    def getids(self, items):
+        """
+        vectorized version of getid
+
+        :param items: array of items
+        :return: array of their ids
+        """
+        if self.index is None or len(self.index) != self.size:
+            self.index = pd.Index(self.id2item, dtype=object)
+        ids = self.index.get_indexer(items)
+        if (ids < 0).any():
+            raise KeyError(np.asarray(items, dtype=object)[ids < 0][0])
+        return ids
+
+    def items(self, ids):
+        """
+        vectorized version of __getitem__
+
+        :param ids: array of ids
+        :return: array of items
+        """
+        return self.id2item[np.asarray(ids, dtype=int)]
+
     def __len__(self):
-        return len(self.id2item)
+        return self.size
 
     def add(self, val):
-        self.id2item.append(val)
-        self.item2id[val] = len(self.id2item) - 1
+        if self.size == len(self.array):
+            array = np.empty(2 * len(self.array), dtype=object)
+            array[:self.size] = self.array
+            self.array = array
+        self.array[self.size] = val
+        self.item2id[val] = self.size
+        self.size += 1
 
     def add2(self, val):
         if val not in self.item2id:
             self.add(val)
 
 
+def camel_split(path):
+    """
+    :param path: file path
+    :return: tokens from path split by '/' and camel case
+    """
+    tokens = []
+    cur_token = ""
+    for c in path:
+        if c == '/':
+            tokens.append(cur_token)
+            cur_token = ""
+        elif c.isupper():
+            tokens.append(cur_token)
+            cur_token = c
+        else:
+            cur_token += c
+    return tokens
+
+
+class PathTable:
+    """
+    interned file paths. Each file id maps to a tuple of path component ids, a tuple of camel case token ids and sets
+    of them, so paths are split only once and the path similarities compare integers
+
+    :param files: ItemMap with file paths. When None, the table starts empty and paths are added by getid
+    """
+
+    def __init__(self, files=None):
+        self.files = ItemMap() if files is None else files
+        self.components = {}
+        self.tokens = {}
+        self.file_components = []
+        self.file_tokens = []
+        self.component_sets = []
+        self.token_sets = []
+        for i in range(len(self.files)):
+            self.intern(self.files[i])
+
+    def intern(self, path):
+        """
+        splits the path of the next file id into component and camel case token ids
+        """
+        components = tuple(self.components.setdefault(c, len(self.components)) for c in path.split('/'))
+        tokens = tuple(self.tokens.setdefault(t, len(self.tokens)) for t in camel_split(path))
+        self.file_components.append(components)
+        self.file_tokens.append(tokens)
+        self.component_sets.append(set(components))
+        self.token_sets.append(set(tokens))
+
+    def getid(self, path):
+        """
+        :return: id of the file path. Paths that are not in the table are added to it
+        """
+        if path not in self.files:
+            self.files.add(path)
+            self.intern(path)
+        return self.files.getid(path)
+
+    def __len__(self):
+        return len(self.file_components)
+
+
+def copy_dataset(dataset):
+    """
+    copies GerritLoader-like object without copying the data. Dataframes are copied column by column, so changes of
+    the copy do not affect the original, but lists and strings in the cells are shared
+    """
+    if dataset is None:
+        return None
+    dataset = copy.copy(dataset)
+    for name, value in vars(dataset).items():
+        if isinstance(value, pd.DataFrame):
+            setattr(dataset, name, value.copy())
+    return dataset
+
+
 def time_interval(col, from_date, to_date):
     """
     :return: column with rows which lies within [from_data; to_date]
@@ -48,6 +196,93 @@ def time_interval(col, from_date, to_date):
     return (col >= from_date) & (col <= to_date)
 
 
+def group_unique(df, key, col, container=list):
+    """
+    vectorized version of df.groupby(key)[col].agg(lambda x: container(set(x)))
+
+    :param df: dataframe
+    :param key: column to group by
+    :param col: column to aggregate
+    :param container: type of the aggregated values
+    :return: series indexed with sorted keys with unique values of col for each key in order of their appearance
+    """
+    df = df[[key, col]].drop_duplicates()
+    df = df[df[key].notna()].sort_values(key, kind='stable')
+
+    keys = df[key].to_numpy()
+    if not len(keys):
+        return pd.Series([], index=pd.Index(keys, name=key), name=col, dtype=object)
+
+    values = df[col].tolist()
+    bounds = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    starts = np.concatenate(([0], bounds)).tolist()
+    ends = np.concatenate((bounds, [len(keys)])).tolist()
+    return pd.Series([container(values[s:e]) for s, e in zip(starts, ends)],
+                     index=pd.Index(keys[starts], name=key), name=col, dtype=object)
+
+
+def map_unique(col, f):
+    """
+    applies function to the unique values of the column. Repeated values (e.g. file paths) are processed once
+
+    :param col: column to transform
+    :param f: function that transforms series of the unique values
+    :return: transformed column. Missing values are kept
+    """
+    codes, uniques = pd.factorize(col)
+    values = f(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)
+    result = np.empty(len(codes), dtype=object)
+    result[:] = values[codes] if len(values) else np.nan
+    result[codes < 0] = np.nan
+    return pd.Series(result, index=col.index, name=col.name)
+
+
+def read_shard(file_path, use_arrow=False, columns=None):
+    """
+    reads a single csv file from MR-loader. Result is the same for both readers
+
+    :param file_path: path to the csv file
+    :param use_arrow: when True pyarrow csv reader is used instead of the pandas one
+    :param columns: columns to read. When None all columns are read
+    :return: dataframe with the file content and time spent on reading in seconds
+    """
+    start = time.perf_counter()
+    if use_arrow:
+        with open(file_path, newline='') as f:
+            header = next(csv.reader(f, delimiter='|'))
+        columns = header if columns is None else [c for c in header if c in columns]
+        # all columns are read as strings, so pyarrow does not parse dates. numbers and booleans are converted below
+        table = pa_csv.read_csv(file_path,
+                                parse_options=pa_csv.ParseOptions(delimiter='|', newlines_in_values=True),
+                                convert_options=pa_csv.ConvertOptions(column_types={c: pa.string() for c in columns},
+                                                                      include_columns=columns,
+                                                                      strings_can_be_null=True))
+        for i, col in enumerate(table.column_names):
+            for t in [pa.int64(), pa.float64()]:
+                try:
+                    table = table.set_column(i, col, table.column(i).cast(t))
+                    break
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    pass
+            else:
+                column = table.column(i)
+                values = set(pc.unique(column.drop_null()).to_pylist())
+                if len(values) and values <= set(TRUE_VALUES + FALSE_VALUES):
+                    # missing values stay missing, as pandas reads such columns as objects with nan
+                    is_true = pc.if_else(pc.is_valid(column), pc.is_in(column, value_set=pa.array(TRUE_VALUES)), None)
+                    table = table.set_column(i, col, is_true)
+        df = table.to_pandas()
+        # pandas reader marks missing values with nan and reads empty columns as floats
+        for col in df.columns[df.dtypes == object]:
+            if len(df) and df[col].isna().all():
+                df[col] = df[col].astype(float)
+            elif df[col].isna().any():
+                df[col] = df[col].where(df[col].notna(), np.nan)
+    else:
+        df = pd.read_csv(file_path, sep='|', usecols=columns)
+    return df, time.perf_counter() - start
+
+
 def user_id_split(user_id):
     """
     :return: split user_id into name, email, and login
@@ -63,14 +298,31 @@ def get_all_reviewers(events):
     """
     collects all possible reviewers
     """
+    return unique_reviewers(reviewer for event in events if event['type'] == 'pull' for reviewer in event["reviewer"])
+
+
+def unique_reviewers(reviewers):
+    """
+    :param reviewers: reviewers of the pulls in order of the stream
+    :return: list of the unique reviewers in order of the set
+    """
     reviewer_set = set()
-    for event in events:
-        if event['type'] == 'pull':
-            for reviewer in event["reviewer"]:
-                reviewer_set.add(reviewer)
+    for reviewer in reviewers:
+        reviewer_set.add(reviewer)
     return list(reviewer_set)
 
 
+def get_encoded_reviewers(events, users):
+    """
+    :param events: stream of the encoded events
+    :param users: ItemMap of the users
+    :return: ids of the reviewers in order of get_all_reviewers for the same events before encoding, so the models
+        break ties between reviewers in the same way in both modes
+    """
+    values, _ = events.column('reviewer')
+    return users.getids(unique_reviewers(users.items(values))).tolist()
+
+
 def is_word_useful(word):
     """
     word filtering. removes digits and websites
@@ -83,9 +335,11 @@ def is_word_useful(word):
     return True
 
 
+@functools.lru_cache(maxsize=None)
 def word_stem(word):
     """
-    removes punctuation and stems with LancasterStemmer
+    removes punctuation and stems with LancasterStemmer. Results are memoized, since the same words repeat in many
+    titles
     """
     if word.endswith('.') or word.endswith(',') or word.endswith(':') or word.endswith('\'') or word.endswith('\"'):
         word = word[:-1]
@@ -120,14 +374,45 @@ def get_all_words(events):
     return l
 
 
+def get_title_tokens(titles, n_jobs=1):
+    """
+    tokenizes titles once for the text-based models. Each distinct title is processed once
+
+    :param titles: series of pull titles
+    :param n_jobs: number of processes used to split and stem the titles
+    :return: list of all words (as in get_all_words) and list with int32 array of word ids for each title. Words of
+        the title are split by spaces and only the ones from the list of all words are kept
+    """
+    codes, unique = pd.factorize(titles)
+    if n_jobs == 1 or len(unique) < 2:
+        words = [split_text(title) for title in unique]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            words = list(executor.map(split_text, unique, chunksize=max(1, len(unique) // (4 * n_jobs))))
+
+    vocabulary = {}
+    for title_words in words:
+        for w in title_words:
+            vocabulary.setdefault(w, len(vocabulary))
+    tokens = [np.array([vocabulary[w] for w in title.split(' ') if w in vocabulary], dtype=np.int32)
+              for title in unique]
+    return list(vocabulary), [tokens[c] for c in codes]
+
+
+BOT_WORDS = re.compile('(?:bot|test|jenkins|zuul|automation|build|job|infra)', re.IGNORECASE)
+BOT_CI = re.compile('ci', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=None)
+def project_pattern(project):
+    return re.compile(project, re.IGNORECASE)
+
+
 def is_bot(x, project=''):
     """
     Filter function for non-human contributors
     """
     name, _, login = user_id_split(x)
-    mask_word = re.compile('(bot|test|jenkins|zuul|automation|build|job|infra)', re.IGNORECASE)
-    mask_ci = re.compile('ci', re.IGNORECASE)
-    mask_pr = re.compile(project, re.IGNORECASE)
 
     name_ent = name
     if name_ent is np.nan:
@@ -136,26 +421,166 @@ def is_bot(x, project=''):
     if name_ent is np.nan:
         return False
 
-    if len(re.findall(mask_pr, name_ent)):
-        return True
+    return bool(project_pattern(project).search(name_ent) or BOT_WORDS.search(name_ent) or BOT_CI.search(name_ent))
+
+
+class BotClassifier:
+    """
+    batch version of is_bot. Patterns are matched against the whole array of users at once. Project independent
+    part of the classification is cached by the user id, so only new users are matched on the next runs
+
+    :param cache_dir: folder where classified users are saved. When None they are kept in memory only
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self.cache_key = get_key('bots', BOT_WORDS.pattern, BOT_CI.pattern)
+        self.known = None
+        if cache_dir is not None:
+            self.known = load_cache(cache_dir, self.cache_key)
+        if self.known is None:
+            self.known = pd.Series([], dtype=bool)
+
+    @staticmethod
+    def get_names(users):
+        """
+        :return: name part of the user ids as in user_id_split
+        """
+        parts = users.str.rsplit(':', n=2)
+        return parts.str[0].where(parts.str.len() == 3, '')
+
+    def __call__(self, users, project=''):
+        """
+        :param users: array of user ids
+        :param project: name of the project. Users with it in the name are considered bots
+        :return: boolean array. True for bots
+        """
+        users = pd.Series(users, dtype=object)
+        new = pd.unique(users[~users.isin(self.known.index)])
+        if len(new):
+            names = self.get_names(pd.Series(new, dtype=object))
+            flags = names.str.contains(BOT_WORDS) | names.str.contains(BOT_CI)
+            self.known = pd.concat([self.known, pd.Series(flags.to_numpy(), index=new)])
+            if self.cache_dir is not None:
+                save_cache(self.cache_dir, self.cache_key, self.known)
+
+        flags = self.known.reindex(users).to_numpy()
+        return flags | self.get_names(users).str.contains(project_pattern(project)).to_numpy()
+
+
+# classifiers are shared, so preprocessing for several models reuses classified users
+bot_classifiers = {}
+
+
+def get_bot_classifier(cache_dir=None):
+    """
+    :param cache_dir: folder of the classifier cache
+    :return: shared BotClassifier for the folder
+    """
+    if cache_dir not in bot_classifiers:
+        bot_classifiers[cache_dir] = BotClassifier(cache_dir)
+    return bot_classifiers[cache_dir]
+
+
+def flatten_lists(col):
+    """
+    :param col: column with list-like values
+    :return: array with all values of the lists and array with the row position of each value
+    """
+    lengths = np.fromiter(map(len, col), dtype=np.int64, count=len(col))
+    values = np.empty(lengths.sum(), dtype=object)
+    values[:] = list(itertools.chain.from_iterable(col))
+    return values, np.repeat(np.arange(len(col)), lengths)
+
 
-    if len(re.findall(mask_word, name_ent)):
-        return True
+def unflatten_lists(values, rows, n_rows, unique=False):
+    """
+    inverse of flatten_lists
 
-    if len(re.findall(mask_ci, name_ent)):
-        return True
+    :param values: flat array of values
+    :param rows: sorted row positions of the values
+    :param n_rows: number of rows
+    :param unique: when True repeated values of a row are dropped as with list(set(x))
+    :return: list with list of values for each row
+    """
+    bounds = np.searchsorted(rows, np.arange(n_rows + 1)).tolist()
+    values = values.tolist()
+    if unique:
+        return [list(set(values[s:e])) for s, e in zip(bounds[:-1], bounds[1:])]
+    return [values[s:e] for s, e in zip(bounds[:-1], bounds[1:])]
 
-    return False
 
+def unflatten_arrays(values, rows, n_rows):
+    """
+    inverse of flatten_lists for ids. Arrays of the rows are views of one array, so values are not copied
+
+    :param values: flat array of values
+    :param rows: sorted row positions of the values
+    :param n_rows: number of rows
+    :return: object array with an int32 array of values for each row
+    """
+    if n_rows == 0:
+        return np.empty(0, dtype=object)
+    values = np.asarray(values, dtype=np.int32)
+    return pd.Series(np.split(values, np.searchsorted(rows, np.arange(1, n_rows))), dtype=object).to_numpy()
 
-def preprocess_users(data, remove_bots, bots, factorize_users, alias, project_name, threshold=0.1):
-    u1 = pd.unique(data.pulls.owner.sum())
-    u2 = pd.unique(data.pulls.reviewer.sum())
-    u3 = pd.unique(data.commits.key_user)
-    u4 = pd.unique(data.comments.key_user)
-    u5 = pd.unique(data.pulls.author.apply(lambda x: list(x)).sum())
 
-    users = np.unique(np.hstack((u1, u2, u3, u4, u5)))
+def map_values(values, mapping):
+    """
+    vectorized version of [mapping[v] for v in values]
+
+    :param values: array of values
+    :param mapping: dict
+    :return: array with mapped values
+    """
+    keys = pd.Index(list(mapping.keys()))
+    pos = keys.get_indexer(values)
+    if (pos < 0).any():
+        raise KeyError(values[pos < 0][0])
+    return np.array(list(mapping.values()))[pos]
+
+
+def have_common(values1, rows1, values2, rows2, n_rows):
+    """
+    vectorized version of [len(set(x).intersection(set(y))) > 0 for x, y in zip(lists1, lists2)]
+
+    :param values1: flat values of the first lists
+    :param rows1: row positions of values1
+    :param values2: flat values of the second lists
+    :param rows2: row positions of values2
+    :param n_rows: number of rows
+    :return: boolean array. True for rows where the lists have a common value
+    """
+    codes, uniques = pd.factorize(np.concatenate([values1, values2]))
+    keys = rows1 * len(uniques) + codes[:len(values1)]
+    common = rows1[np.isin(keys, rows2 * len(uniques) + codes[len(values1):])]
+    return np.bincount(common, minlength=n_rows) > 0
+
+
+def preprocess_users(data, remove_bots, bots, factorize_users, alias, project_name, threshold=0.1, cache_dir=None,
+                     n_jobs=1, self_review=False):
+    """
+    removes bots and replaces users with their ids. Lists of users are flattened, so all operations are linear in
+    the number of events
+
+    :param data: GerritLoader-like object. It is changed inplace
+    :param remove_bots: when True bots are removed
+    :param bots: path to the csv with bots or 'auto' to detect them by name
+    :param factorize_users: when True users are replaced with ids
+    :param alias: when True aliases of the same user get the same id
+    :param project_name: name of the project. Users with it in the name are considered bots
+    :param threshold: distance threshold for the alias matching
+    :param cache_dir: folder where automatically classified bots and matched aliases are cached
+    :param n_jobs: number of processes used for the alias matching
+    :param self_review: when True self_review column is added to the pulls. It is True when one of the reviewers is
+        an alias of one of the authors
+    :return: dict from users to their ids when factorize_users is True
+    """
+    list_cols = ['owner', 'reviewer', 'author']
+    flat = {col: flatten_lists(data.pulls[col]) for col in list_cols}
+    users = np.unique(pd.unique(np.concatenate([flat[col][0] for col in list_cols] +
+                                               [data.commits.key_user.to_numpy(dtype=object),
+                                                data.comments.key_user.to_numpy(dtype=object)])))
 
     if remove_bots:
         if bots != 'auto':
@@ -163,25 +588,34 @@ def preprocess_users(data, remove_bots, bots, factorize_users, alias, project_na
             bots = bots.apply(lambda x: f'{x["name"]}:{x["email"]}:{x["login"]}', axis=1)
             bots = set(bots)
         else:
-            bots = set([u for u in users if is_bot(u, project_name)])
+            bots = users[get_bot_classifier(cache_dir)(users, project_name)]
+        bots = pd.Index(list(bots), dtype=object)
 
-        users = np.array([u for u in users if u not in bots])
+        users = users[~pd.Index(users).isin(bots)]
 
-        data.pulls['owner'] = data.pulls['owner'].apply(lambda x: [u for u in x if u not in bots])
-        data.pulls['reviewer'] = data.pulls['reviewer'].apply(lambda x: [u for u in x if u not in bots])
-        data.pulls['author'] = data.pulls['author'].apply(lambda x: [u for u in x if u not in bots])
+        for col in list_cols:
+            values, rows = flat[col]
+            keep = ~pd.Index(values, dtype=object).isin(bots)
+            flat[col] = values[keep], rows[keep]
 
-        data.pulls = data.pulls[data.pulls.owner.apply(lambda x: len(x) > 0)]
-        data.pulls = data.pulls[data.pulls.reviewer.apply(lambda x: len(x) > 0)]
+        n_owners = np.bincount(flat['owner'][1], minlength=len(data.pulls))
+        n_reviewers = np.bincount(flat['reviewer'][1], minlength=len(data.pulls))
+        keep = (n_owners > 0) & (n_reviewers > 0)
+        # row positions are renumbered for the remaining pulls
+        new_rows = np.cumsum(keep) - 1
+        for col in list_cols:
+            values, rows = flat[col]
+            flat[col] = values[keep[rows]], new_rows[rows[keep[rows]]]
 
-        data.commits['key_user'] = data.commits['key_user'].apply(lambda x: np.nan if x in bots else x)
-        data.comments['key_user'] = data.comments['key_user'].apply(lambda x: np.nan if x in bots else x)
+        data.pulls = data.pulls[keep]
 
-        data.comments = data.comments[~data.comments.key_user.isna()]
-        data.commits = data.commits[~data.commits.key_user.isna()]
+        data.commits = data.commits[data.commits.key_user.notna() & ~data.commits.key_user.isin(bots)]
+        data.comments = data.comments[data.comments.key_user.notna() & ~data.comments.key_user.isin(bots)]
 
+    self_reviews = None
     if factorize_users:
-        if alias:
+        alias_clusters = None
+        if alias or self_review:
             users_parts = [user_id_split(s) for s in users]
 
             users_df = pd.DataFrame({'email': [u[1] for u in users_parts],
@@ -189,27 +623,31 @@ def preprocess_users(data, remove_bots, bots, factorize_users, alias, project_na
                                      'login': [u[2] for u in users_parts],
                                      'initial_id': [u for u in users]})
 
-            clusters = BirdMatching(distance_threshold=threshold).get_clusters(users_df)
-        else:
-            clusters = {u: i for i, u in enumerate(users)}
-
-        data.clusters = clusters
-        data.pulls.owner = data.pulls.owner.apply(lambda x: list(set([clusters[u] for u in x])))
-        data.pulls.author = data.pulls.author.apply(lambda x: list(set([clusters[u] for u in x])))
-        data.pulls.reviewer = data.pulls.reviewer.apply(lambda x: list(set([clusters[u] for u in x])))
-
-        data.commits.key_user = data.commits.key_user.apply(lambda x: clusters[x])
-        data.comments.key_user = data.comments.key_user.apply(lambda x: clusters[x])
+            # imported here since batcore.alias uses the cache of batcore.data
+            from batcore.alias import get_clusters
+            alias_clusters = get_clusters(users_df, threshold, n_jobs, cache_dir)
 
-        return clusters
+        if self_review:
+            # self-reviews are always found with aliases
+            self_reviews = have_common(map_values(flat['reviewer'][0], alias_clusters), flat['reviewer'][1],
+                                       map_values(flat['author'][0], alias_clusters), flat['author'][1],
+                                       len(data.pulls))
 
+        clusters = alias_clusters if alias else {u: i for i, u in enumerate(users)}
 
-def add_self_review(data_a, data_f):
-    try:
-        data_f.pulls.drop('self_review', axis=1)
-    except KeyError:
-        pass
+        data.clusters = clusters
+        flat = {col: (map_values(values, clusters), rows) for col, (values, rows) in flat.items()}
+        data.commits = data.commits.assign(key_user=map_values(data.commits.key_user.to_numpy(dtype=object), clusters))
+        data.comments = data.comments.assign(key_user=map_values(data.comments.key_user.to_numpy(dtype=object),
+                                                                 clusters))
+    elif self_review:
+        self_reviews = have_common(*flat['reviewer'], *flat['author'], len(data.pulls))
+
+    if remove_bots or factorize_users:
+        data.pulls = data.pulls.assign(**{col: unflatten_lists(values, rows, len(data.pulls), unique=factorize_users)
+                                          for col, (values, rows) in flat.items()})
+    if self_review:
+        data.pulls = data.pulls.assign(self_review=self_reviews)
 
-    data_f.pulls['self_review'] = data_a.pulls.apply(lambda x:
-                                                     len(set(x.reviewer).intersection(set(x.author))) > 0,
-                                                     axis=1)
+    if factorize_users:
+        return clusters
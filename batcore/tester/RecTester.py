@@ -36,9 +36,9 @@ class RecTester(TesterBase):
         for (train_data, test_data) in tqdm(data_iterator):
             cnt += 1
             recommender.fit(train_data)
-            if len(test_data):
-                cur_rec = recommender.predict(test_data, n=max(top_ns))
-                y_pred = [[*[cur_rec[:n] for n in top_ns], test_data['reviewer'], test_data['key_change']]]
+            for pull in self.test_batch(test_data):
+                cur_rec = recommender.predict(pull, n=max(top_ns))
+                y_pred = [[*[cur_rec[:n] for n in top_ns], pull['reviewer'], pull['key_change']]]
                 y_pred = pd.DataFrame(y_pred, columns=[*[f'top-{n}' for n in top_ns], 'rev', 'key'])
                 self.recs.append(y_pred)
             self.info(f"finished pull request #{cnt}")
@@ -82,10 +82,10 @@ class RecTesterAliasTest(TesterBase):
             for (train_data, test_data) in tqdm(data_iterator):
                 cnt += 1
                 recommender.fit(train_data)
-                if len(test_data):
-                    cur_rec = recommender.predict(test_data, n=max(top_ns))
-                    preds = [[*[cur_rec[:n] for n in top_ns], test_data['reviewer'], test_data[flag],
-                              test_data['key_change']]]
+                for pull in self.test_batch(test_data):
+                    cur_rec = recommender.predict(pull, n=max(top_ns))
+                    preds = [[*[cur_rec[:n] for n in top_ns], pull['reviewer'], pull[flag],
+                              pull['key_change']]]
                     preds = pd.DataFrame(preds, columns=[*[f'top-{n}' for n in top_ns], 'rev', 'filter_flag', 'key'])
                     self.recs.append(preds)
                 self.info(f"finished pull request #{cnt}")
@@ -21,3 +21,13 @@ class TesterBase(ABC, Logger):
                          log_mode='a',
                          *args, **kwargs):
         self.setup_logger(verbose, log_file_path, log_stdout, log_mode)
+
+    @staticmethod
+    def test_batch(test_data):
+        """
+        :param test_data: test event or list of test events (e.g. from TimeWindowLoader)
+        :return: list of test events. All of them are predicted with the same fitted recommender
+        """
+        if isinstance(test_data, list):
+            return test_data
+        return [test_data] if len(test_data) else []
@@ -0,0 +1,131 @@
+"""
+checks that the blocked alias clustering gives the same clusters as the complete linkage of all users and compares
+their time
+
+python benchmarks/alias_clustering.py --n_people 300
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from aliasmatching import BirdMatching
+from scipy.cluster.hierarchy import fcluster, linkage
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from batcore.alias import get_clusters
+from batcore.alias.utils import get_blocks, prepare_users, tie_breaker
+
+FIRST = ['li', 'wu', 'jo', 'al', 'ann', 'bob', 'max', 'ivan', 'john', 'maria', 'alexander', 'christopher', 'katherine',
+         'sebastian', 'anastasia']
+LAST = ['li', 'wu', 'ng', 'ma', 'xu', 'kim', 'lee', 'smith', 'novak', 'petrov', 'johnson', 'rodriguez',
+        'vandenberg', 'kowalczyk', 'fitzgerald']
+
+
+def typo(s, rng):
+    """
+    :return: string with one changed character
+    """
+    i = rng.integers(len(s))
+    return s[:i] + 'xz'[s[i] == 'x'] + s[i + 1:]
+
+
+def generate_users(n_people=300, seed=0):
+    """
+    generates users with several aliases for each person: same names with different handles, handles with the name
+    inside, short names and names or handles with typos
+
+    :param n_people: number of persons
+    :param seed: random seed
+    :return: dataframe with name, email, login and initial_id columns
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for p in range(n_people):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        name = f'{first} {last}'
+        handle = f'{first}{last}{p}'
+        variants = [(name, f'{handle}@example.org', handle),
+                    (name, f'{first}.{last}@mail.com', ''),
+                    ('', f'{handle}@example.org', ''),
+                    ('', '', handle),
+                    (typo(name, rng), '', f'{last}{p}'),
+                    ('', f'{typo(handle, rng)}@example.org', '')]
+        for i in rng.choice(len(variants), rng.integers(1, 4), replace=False):
+            rows.append(variants[i])
+    users = pd.DataFrame(rows, columns=['name', 'email', 'login'])
+    users['initial_id'] = users.name + ':' + users.email + ':' + users.login
+    return users.drop_duplicates('initial_id').reset_index(drop=True)
+
+
+def partition(clusters, ids):
+    """
+    :return: set of clusters as sets of user ids
+    """
+    groups = {}
+    for i in ids:
+        groups.setdefault(clusters[i], set()).add(i)
+    return {frozenset(group) for group in groups.values()}
+
+
+def complete_linkage(records, matcher):
+    """
+    complete linkage of all pairs of users as in BirdMatching.get_clusters. Ties of the distances are broken as in
+    get_clusters, otherwise the clusters depend on the order of the users
+
+    :return: list with the cluster label of each user
+    """
+    distances = [matcher.distance(records[i], records[j]) + tie_breaker(records[i], records[j])
+                 for i in range(len(records)) for j in range(i + 1, len(records))]
+    threshold = np.nextafter(matcher.distance_threshold, 0)
+    return fcluster(linkage(np.array(distances), 'complete'), threshold, 'distance')
+
+
+def timeit(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_people', type=int, default=300)
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--n_calls', type=int, default=3, help='number of the cached calls for the new users')
+    args = parser.parse_args()
+
+    users = generate_users(args.n_people)
+    ids = users.initial_id.tolist()
+    print(f'{len(users)} users')
+
+    matcher = BirdMatching(distance_threshold=args.threshold)
+    records = prepare_users(users).to_dict('records')
+    reference, t = timeit(complete_linkage, records, matcher)
+    print(f'complete linkage of all users: {t:.2f}s, {len(set(reference))} clusters')
+    reference = partition(dict(zip(ids, reference)), ids)
+
+    # every pair of users that can be in one cluster should share a block
+    blocked = {pair for block in get_blocks(records, range(len(records))) for pair in
+               ((i, j) for i in block for j in block if i < j)}
+    missed = [(i, j) for i in range(len(records)) for j in range(i + 1, len(records))
+              if (i, j) not in blocked and matcher.distance(records[i], records[j]) < args.threshold]
+    assert not missed, f'{len(missed)} pairs of aliases are not blocked, e.g. {ids[missed[0][0]]}, {ids[missed[0][1]]}'
+
+    clusters, t = timeit(get_clusters, users, args.threshold)
+    print(f'blocked: {t:.2f}s, {len(set(clusters.values()))} clusters')
+    assert partition(clusters, ids) == reference, 'blocked clusters differ from the complete linkage'
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for part in np.array_split(np.random.default_rng(1).permutation(len(users)), args.n_calls):
+            get_clusters(users.iloc[np.sort(part)], args.threshold, cache_dir=cache_dir)
+        clusters = get_clusters(users, args.threshold, cache_dir=cache_dir)
+    assert partition(clusters, ids) == reference, 'cached clusters differ from the complete linkage'
+    print(f'{args.n_calls} cached calls: same clusters')
+
+
+if __name__ == '__main__':
+    main()
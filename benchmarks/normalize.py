@@ -0,0 +1,54 @@
+"""
+compares per-row lambdas with the vectorized normalization of MR-loader tables used in MRLoaderData.prepare
+
+python benchmarks/normalize.py --n_changes 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+pd.options.mode.chained_assignment = None
+
+from batcore.data.MRLoaderData import normalize
+from synthetic import generate
+
+
+def lambda_normalize(data):
+    """
+    normalization as it was implemented with lambdas for each row
+    """
+    for table in ['changes_files', 'commits_file', 'comments_file']:
+        data[table]['key_file'] = data[table]['key_file'].apply(lambda x: x.replace(':', '/'))
+    data['changes']['comment'] = data['changes']['comment'].fillna('').apply(lambda x: x.split('Reviewed-on')[0])
+    for table, col in [('commits', 'committed_date'), ('changes', 'created_at'), ('changes', 'updated_time'),
+                       ('comments_file', 'time'), ('comments_patch', 'time')]:
+        # dates were parsed twice
+        for _ in range(2):
+            data[table][col] = pd.to_datetime(data[table][col]).dt.tz_localize(None)
+
+
+def timeit(f, *args):
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_changes', type=int, default=100000)
+    args = parser.parse_args()
+
+    tables = generate(args.n_changes)
+    n_files = sum(len(tables[name]) for name in ['changes_files', 'commits_file', 'comments_file'])
+    print(f'{args.n_changes} pulls, {n_files} file rows')
+
+    print(f"lambdas: {timeit(lambda_normalize, {name: df.copy() for name, df in tables.items()}):.2f}s")
+    print(f"vectorized: {timeit(normalize, {name: df.copy() for name, df in tables.items()}):.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+compares per-group python lambdas with vectorized aggregations used in MRLoaderData.prepare_pulls
+
+python benchmarks/prepare_pulls.py --n_changes 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+pd.options.mode.chained_assignment = None
+
+from batcore.data import MRLoaderData
+from batcore.data.utils import group_unique
+from synthetic import generate
+
+
+def lambda_aggregation(data):
+    """
+    aggregations as they were implemented with lambdas for each group
+    """
+    files = data['changes_files'].groupby('key_change')['key_file'].agg(lambda x: list(set(x)))
+    reviewers = data['changes_reviewer'].groupby('key_change')['key_user'].agg(lambda x: list(set(x)))
+    pulls = data['changes'].join(files.rename('file'), on='key_change', how='inner').join(
+        reviewers.rename('reviewer'), on='key_change', how='inner')
+    pulls = pulls.groupby('key_change')[['file', 'reviewer', 'created_at', 'key_user', 'comment', 'status']].agg(
+        {'file': lambda x: list(x)[0],
+         'reviewer': lambda x: list(x)[0],
+         'created_at': lambda x: list(x)[0],
+         'key_user': lambda x: list(set(x)),
+         'comment': lambda x: list(x)[0],
+         'status': lambda x: list(x)[0]}).reset_index()
+    authors = data['commits'].merge(data['commits_author'], on='key_commit').groupby('key_change').agg(
+        {'author_key_user': lambda x: set(x)}).reset_index()
+    return pulls.merge(authors, on='key_change', how='left')
+
+
+def vectorized_aggregation(data):
+    """
+    the same aggregations with kernels used in MRLoaderData
+    """
+    files = group_unique(data['changes_files'], 'key_change', 'key_file')
+    reviewers = group_unique(data['changes_reviewer'], 'key_change', 'key_user')
+    pulls = data['changes'].join(files.rename('file'), on='key_change', how='inner').join(
+        reviewers.rename('reviewer'), on='key_change', how='inner')
+    owners = group_unique(pulls, 'key_change', 'key_user')
+    pulls = pulls.drop_duplicates('key_change').sort_values('key_change', kind='stable')
+    pulls = pulls[['key_change', 'file', 'reviewer', 'created_at', 'comment', 'status']].join(owners, on='key_change')
+    authors = group_unique(data['commits'].merge(data['commits_author'], on='key_commit'), 'key_change',
+                           'author_key_user', container=set)
+    return pulls.join(authors, on='key_change')
+
+
+def timeit(f, *args):
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_changes', type=int, default=100000)
+    parser.add_argument('--path', type=str, default=None,
+                        help='folder for the synthetic dump. When set the full MRLoaderData processing is timed too')
+    args = parser.parse_args()
+
+    tables = generate(args.n_changes)
+    print(f"{args.n_changes} pulls, {len(tables['changes_files'])} pull files, "
+          f"{len(tables['changes_reviewer'])} reviewers")
+
+    print(f'lambdas: {timeit(lambda_aggregation, tables):.2f}s')
+    print(f'vectorized: {timeit(vectorized_aggregation, tables):.2f}s')
+
+    dataset = MRLoaderData.__new__(MRLoaderData)
+    dataset.from_date, dataset.to_date = None, None
+    data = {name: df.reset_index() for name, df in tables.items()}
+
+    def vectorized(data):
+        dataset.pulls, dataset.commits, dataset.comments = dataset.prepare(data)
+        dataset.prepare_pulls()
+
+    print(f'prepare + prepare_pulls: {timeit(vectorized, data):.2f}s')
+
+    if args.path is not None:
+        from synthetic import write
+        write(args.path, tables)
+        print(f'MRLoaderData: {timeit(MRLoaderData, args.path):.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+compares list concatenation with the flattened user preprocessing used in StandardDataset
+
+python benchmarks/preprocess_users.py --n_pulls 1000000
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+pd.options.mode.chained_assignment = None
+
+from batcore.data.utils import copy_dataset, is_bot, preprocess_users
+
+
+def generate_users(n_pulls=100000, n_users=5000, seed=0):
+    """
+    generates GerritLoader-like object with user columns only
+
+    :param n_pulls: number of pull requests
+    :param n_users: number of users
+    :param seed: random seed
+    :return: object with pulls, commits and comments dataframes
+    """
+    rng = np.random.default_rng(seed)
+    users = np.array([f'User {i}:user{i}@example.org:user{i}' for i in range(n_users)] +
+                     ['Zuul CI:zuul@ci.org:zuul', 'Jenkins:jenkins@ci.org:jenkins'], dtype=object)
+
+    def lists(low, high, container=list):
+        lengths = rng.integers(low, high, n_pulls)
+        values = rng.choice(users, lengths.sum()).tolist()
+        bounds = np.concatenate(([0], np.cumsum(lengths))).tolist()
+        return [container(values[s:e]) for s, e in zip(bounds[:-1], bounds[1:])]
+
+    pulls = pd.DataFrame({'key_change': np.arange(n_pulls),
+                          'owner': lists(1, 2),
+                          'reviewer': lists(1, 5),
+                          'author': lists(0, 3, set)})
+    commits = pd.DataFrame({'key_change': np.repeat(pulls.key_change, 2),
+                            'key_user': rng.choice(users, 2 * n_pulls)})
+    comments = pd.DataFrame({'key_change': rng.choice(pulls.key_change, 3 * n_pulls),
+                             'key_user': rng.choice(users, 3 * n_pulls)})
+    return SimpleNamespace(pulls=pulls, commits=commits, comments=comments)
+
+
+def concat_preprocess_users(data, project_name):
+    """
+    bot removal and factorization as they were implemented with list concatenation and lambdas for each row
+    """
+    u1 = pd.unique(data.pulls.owner.sum())
+    u2 = pd.unique(data.pulls.reviewer.sum())
+    u3 = pd.unique(data.commits.key_user)
+    u4 = pd.unique(data.comments.key_user)
+    u5 = pd.unique(data.pulls.author.apply(lambda x: list(x)).sum())
+    users = np.unique(np.hstack((u1, u2, u3, u4, u5)))
+
+    bots = set([u for u in users if is_bot(u, project_name)])
+    users = np.array([u for u in users if u not in bots])
+    for col in ['owner', 'reviewer', 'author']:
+        data.pulls[col] = data.pulls[col].apply(lambda x: [u for u in x if u not in bots])
+    data.pulls = data.pulls[data.pulls.owner.apply(lambda x: len(x) > 0)]
+    data.pulls = data.pulls[data.pulls.reviewer.apply(lambda x: len(x) > 0)]
+    data.commits['key_user'] = data.commits['key_user'].apply(lambda x: np.nan if x in bots else x)
+    data.comments['key_user'] = data.comments['key_user'].apply(lambda x: np.nan if x in bots else x)
+    data.comments = data.comments[~data.comments.key_user.isna()]
+    data.commits = data.commits[~data.commits.key_user.isna()]
+
+    clusters = {u: i for i, u in enumerate(users)}
+    for col in ['owner', 'reviewer', 'author']:
+        data.pulls[col] = data.pulls[col].apply(lambda x: list(set([clusters[u] for u in x])))
+    data.commits.key_user = data.commits.key_user.apply(lambda x: clusters[x])
+    data.comments.key_user = data.comments.key_user.apply(lambda x: clusters[x])
+
+
+def timeit(f, *args):
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_pulls', type=int, default=100000)
+    parser.add_argument('--n_users', type=int, default=5000)
+    parser.add_argument('--max_concat', type=int, default=100000,
+                        help='list concatenation is quadratic, so it is timed only up to this number of pulls')
+    args = parser.parse_args()
+
+    data = generate_users(args.n_pulls, args.n_users)
+    n_events = sum(data.pulls[col].map(len).sum() for col in ['owner', 'reviewer', 'author'])
+    print(f'{args.n_pulls} pulls, {n_events + len(data.commits) + len(data.comments)} user events')
+
+    if args.n_pulls <= args.max_concat:
+        print(f'concatenation: {timeit(concat_preprocess_users, copy_dataset(data), "openstack"):.2f}s')
+    print(f'flattened: {timeit(preprocess_users, copy_dataset(data), True, "auto", True, False, "openstack"):.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+generator of synthetic MR-loader output used by the benchmarks
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+TABLES = ['changes', 'changes_files', 'changes_reviewer', 'commits', 'commits_file', 'commits_author',
+          'comments_file', 'comments_patch', 'users']
+
+
+def generate(n_changes=10000, n_users=500, n_files=3000, seed=0, start=0):
+    """
+    generates tables in the MR-loader format
+
+    :param n_changes: number of pull requests
+    :param n_users: number of users
+    :param n_files: number of files
+    :param seed: random seed
+    :param start: first key_change. used to generate continuation of the dump
+    :return: dict with dataframes for each of the MR-loader tables
+    """
+    rng = np.random.default_rng(seed)
+    users = np.array([f'User {i}:user{i}@example.org:user{i}' for i in range(n_users)] +
+                     ['Zuul CI:zuul@ci.org:zuul', 'Jenkins:jenkins@ci.org:jenkins'], dtype=object)
+    dirs = [f'project/module{i}/sub{j}' for i in range(20) for j in range(5)]
+    files = np.array([f'{dirs[i % len(dirs)]}:File{i}Name.py' for i in range(n_files)], dtype=object)
+
+    keys = np.arange(start, start + n_changes)
+    dates = pd.Timestamp('2020-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 3 * 365 * 24, n_changes),
+                                                                   unit='h')
+    changes = pd.DataFrame({'key_change': keys, 'key': keys + 1000,
+                            'created_at': dates.astype(str),
+                            'updated_time': (dates + pd.Timedelta(days=2)).astype(str),
+                            'key_user': rng.choice(users, n_changes),
+                            'comment': [f'Fix bug {i} in the compute module\n\nReviewed-on: http://review/{i}'
+                                        if i % 7 else None for i in keys],
+                            'subject': [f'subject {i}' for i in keys],
+                            'status': rng.choice(['MERGED', 'ABANDONED', 'OPEN'], n_changes, p=[.7, .2, .1])})
+
+    n_change_files = rng.integers(1, 15, n_changes)
+    changes_files = pd.DataFrame({'key_change': np.repeat(keys, n_change_files),
+                                  'key_file': rng.choice(files, n_change_files.sum())})
+    n_reviewers = rng.integers(1, 5, n_changes)
+    changes_reviewer = pd.DataFrame({'key_change': np.repeat(keys, n_reviewers),
+                                     'key_user': rng.choice(users, n_reviewers.sum())})
+
+    commit_changes = np.repeat(keys, 2)
+    commits = pd.DataFrame({'key_commit': [f'c{k}_{j}' for k in keys for j in range(2)],
+                            'key_change': commit_changes})
+    commits['oid'] = commits.key_commit
+    commits['committed_date'] = np.repeat(dates.astype(str), 2)
+    for col in ['lines_inserted', 'lines_deleted', 'size', 'size_delta']:
+        commits[col] = 1
+    commits['uploader_key_user'] = 'u'
+    commits['committer_key_user'] = 'u'
+
+    commits_file = commits[['key_commit', 'key_change']].merge(changes_files, on='key_change')
+    commits_file = commits_file.drop('key_change', axis=1)
+    commits_file['status'] = 'MODIFIED'
+    commits_author = pd.DataFrame({'key_commit': commits.key_commit,
+                                   'author_key_user': rng.choice(users, len(commits))})
+
+    comments_file = changes_files.sample(frac=0.5, random_state=seed)
+    comments_file['key_user'] = rng.choice(users, len(comments_file))
+    comments_file['time'] = (pd.Timestamp('2020-01-01', tz='UTC') +
+                             pd.to_timedelta(rng.integers(0, 3 * 365 * 24, len(comments_file)), unit='h')).astype(str)
+    comments_patch = changes_reviewer.sample(frac=0.5, random_state=seed)
+    comments_patch['time'] = (pd.Timestamp('2020-01-01', tz='UTC') +
+                              pd.to_timedelta(rng.integers(0, 3 * 365 * 24, len(comments_patch)), unit='h')).astype(str)
+    comments_patch['oid'] = 'x'
+
+    users = pd.DataFrame({'key_user': users, 'name': [u.split(':')[0] for u in users]})
+
+    return {'changes': changes, 'changes_files': changes_files, 'changes_reviewer': changes_reviewer,
+            'commits': commits, 'commits_file': commits_file, 'commits_author': commits_author,
+            'comments_file': comments_file, 'comments_patch': comments_patch, 'users': users}
+
+
+def write(path, tables, n_shards=4, prefix=0):
+    """
+    writes generated tables in the MR-loader layout: a folder per table with several '|' separated csv files
+
+    :param path: path to the output folder
+    :param tables: dict with dataframes returned by generate
+    :param n_shards: number of csv files per table
+    :param prefix: prefix of the csv file names
+    """
+    for name, df in tables.items():
+        os.makedirs(f'{path}/{name}', exist_ok=True)
+        for i, part in enumerate(np.array_split(df, n_shards)):
+            part.to_csv(f'{path}/{name}/{prefix}_{i}.csv', sep='|', index=False)